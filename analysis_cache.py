@@ -0,0 +1,73 @@
+import threading
+from cache import DiskCache
+from sketches import LibraryAnalytics
+
+
+# Bumped when the stored sketch changes shape, so older entries are recomputed
+SKETCH_VERSION = 2
+
+
+class AnalysisCache:
+    """Stores analyze_playlist results on disk, keyed by playlist and playlist version"""
+
+    def __init__(self, name="analysis"):
+        self.name = name
+        self._store = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = DiskCache(self.name)
+        return self._store
+
+    def analyze(self, client, platform, playlist_ref):
+        """Get (stats, track sketch) for a playlist, reusing stored results while its version is unchanged"""
+        try:
+            version = client.get_playlist_version(playlist_ref)
+        except Exception as e:
+            print(f"Error getting playlist version: {e}")
+            version = None
+
+        key = [platform, playlist_ref]
+        if version:
+            entry = self.store.get(key)
+            if entry and entry.get("version") == version and entry.get("sketch_version") == SKETCH_VERSION:
+                self._count(hit=True)
+                return entry["stats"], entry["sketch"]
+
+        self._count(hit=False)
+        # Fetch the tracks once and hand them to both the analysis and the sketch
+        tracks = client.get_playlist_tracks(playlist_ref)
+        stats = client.analyze_playlist(playlist_ref, tracks=tracks)
+        if not stats:
+            return stats, None
+        sketch = LibraryAnalytics().add_tracks(tracks)
+        # Every track's artist genres, not just the playlist's top few, so library-wide heavy hitters are unbiased
+        genre_counts = client.genre_counts(tracks) if hasattr(client, "genre_counts") else {}
+        sketch.add_genres(genre_counts.items() if genre_counts else stats.get('top_genres', []))
+        sketch = sketch.to_dict()
+        if version:
+            self.store.set(key, {"version": version, "sketch_version": SKETCH_VERSION, "stats": stats, "sketch": sketch})
+        return stats, sketch
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+analysis_cache = AnalysisCache()
@@ -1,68 +1,216 @@
 import requests
+import functools
 import os
+import time
 import json
 import csv
 from datetime import datetime
 from dotenv import load_dotenv
+from metrics import metrics
+from singleflight import SingleFlight
+from http_cache import HTTPCache
+from cache import content_hash
+from recommender import recommender
+from importer import import_into
+from backups import BackupWriter
+from library_mirror import library_mirror
+from search_cache import search_cache
+from progress import progress
+from ratelimit import RateLimiter
 
 load_dotenv()
 
 class AppleMusicClient:
+    # A throttled request was never processed, so any method can be resent; after a
+    # server error only GETs are, since a write may already have gone through
+    THROTTLED = 429
+    SERVER_ERRORS = (500, 502, 503, 504)
+    MAX_RETRIES = 3
+    # Catalog song lookups accept at most 25 ISRCs per request
+    ISRC_BATCH = 25
+    ADD_BATCH = 100
+
     def __init__(self):
         self.developer_token = os.getenv("APPLE_MUSIC_DEV_TOKEN")
         self.user_token = os.getenv("APPLE_MUSIC_USER_TOKEN")
-        self.base_url = "https://api.music.apple.com/v1"
+        self.api_root = "https://api.music.apple.com"
+        self.base_url = f"{self.api_root}/v1"
+        self.storefront = os.getenv("APPLE_MUSIC_STOREFRONT", "us")
         self.headers = {
             "Authorization": f"Bearer {self.developer_token}",
             "Music-User-Token": self.user_token
         }
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.rate_limiter = RateLimiter(float(os.getenv("APPLE_MUSIC_RATE_LIMIT", "20")))
+        self._inflight = SingleFlight()
+        self.http_cache = HTTPCache("apple_http", max_bytes=int(os.getenv("PLAYSYNC_HTTP_CACHE_MB", "64")) * 1024 * 1024)
+
+    def _request(self, method, endpoint, url, **kwargs):
+        """Send a request; GETs are revalidated against the HTTP cache and identical ones in flight are shared"""
+        if method != "GET":
+            return self._send(method, endpoint, url, **kwargs)
+        params = kwargs.get("params")
+        key = (url, tuple(sorted((params or {}).items())))
+        send = functools.partial(self._send, method, endpoint)
+        return self._inflight.do(key, self.http_cache.get, send, url, params)
+
+    def _send(self, method, endpoint, url, **kwargs):
+        """Send a request through the pooled session, retrying throttled calls and failed GETs"""
+        for attempt in range(self.MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            response = metrics.call("apple_music", endpoint, self.session.request, method, url, **kwargs)
+            retry = (response.status_code == self.THROTTLED
+                     or method == "GET" and response.status_code in self.SERVER_ERRORS)
+            if not retry or attempt == self.MAX_RETRIES:
+                return response
+            metrics.record_retry("apple_music", endpoint)
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            time.sleep(min(delay, 30))
+        return response
 
     def get_playlist_tracks(self, playlist_id):
         url = f"{self.base_url}/me/library/playlists/{playlist_id}/tracks"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            raise Exception(f"Failed to get playlist: {response.text}")
-        tracks_data = response.json()['data']
+        params = {"limit": 100, "include": "catalog"}
         tracks = []
-        for track in tracks_data:
-            tracks.append({
-                "name": track['attributes']['name'],
-                "artist": track['attributes']['artistName'],
-                "album": track['attributes'].get('albumName', '')
-            })
+        while url:
+            response = self._request("GET", "playlist_tracks", url, params=params)
+            if response.status_code != 200:
+                raise Exception(f"Failed to get playlist: {response.text}")
+            page = response.json()
+            for track in page['data']:
+                catalog = track.get('relationships', {}).get('catalog', {}).get('data') or [{}]
+                tracks.append({
+                    "name": track['attributes']['name'],
+                    "artist": track['attributes']['artistName'],
+                    "album": track['attributes'].get('albumName', ''),
+                    "apple_id": catalog[0].get('id'),
+                    "isrc": catalog[0].get('attributes', {}).get('isrc'),
+                    "duration_ms": track['attributes'].get('durationInMillis')
+                })
+            url = f"{self.api_root}{page['next']}" if page.get('next') else None
+            params = {"include": "catalog"}
+        library_mirror.upsert(tracks)
         return tracks
 
+    def get_playlist_version(self, playlist_id):
+        """Get a content hash of the playlist attributes
+
+        Attributes carry lastModifiedDate, which changes with the tracks; only
+        playlists without it fall back to hashing every track page.
+        """
+        url = f"{self.base_url}/me/library/playlists/{playlist_id}"
+        response = self._request("GET", "playlist", url)
+        if response.status_code != 200:
+            raise Exception(f"Failed to get playlist info: {response.text}")
+        attributes = response.json()['data'][0]['attributes']
+        if attributes.get('lastModifiedDate'):
+            return content_hash(attributes)
+        return content_hash([attributes, self.get_playlist_tracks(playlist_id)])
+
+    def _search_one(self, query):
+        url = f"{self.base_url}/catalog/{self.storefront}/search"
+        response = self._request("GET", "search", url, params={"term": query, "types": "songs", "limit": 1})
+        if response.status_code != 200:
+            return None
+        songs = response.json().get('results', {}).get('songs', {}).get('data', [])
+        return songs[0]['id'] if songs else None
+
+    def resolve_catalog_ids(self, tracks):
+        """Match tracks to Apple Music catalog song IDs, returning one ID (or None) per track
+
+        Tracks that carry a catalog ID, or whose ID is in the local library
+        mirror, are used as-is and tracks with an ISRC are looked up in bulk,
+        ISRC_BATCH per request. Only the rest fall back to a name/artist text
+        search.
+        """
+        catalog_ids = [
+            track.get('apple_id') or local_id
+            for track, local_id in zip(tracks, library_mirror.resolve(tracks, "apple_id"))
+        ]
+        isrcs = list(dict.fromkeys(
+            track['isrc'].upper() for track, catalog_id in zip(tracks, catalog_ids)
+            if not catalog_id and track.get('isrc')
+        ))
+        by_isrc = {}
+        url = f"{self.base_url}/catalog/{self.storefront}/songs"
+        for i in range(0, len(isrcs), self.ISRC_BATCH):
+            params = {"filter[isrc]": ",".join(isrcs[i:i + self.ISRC_BATCH])}
+            response = self._request("GET", "songs_by_isrc", url, params=params)
+            if response.status_code != 200:
+                continue
+            for song in response.json().get('data', []):
+                by_isrc.setdefault(song['attributes'].get('isrc', '').upper(), song['id'])
+
+        by_query = {}
+        for position, track in enumerate(tracks):
+            if catalog_ids[position]:
+                continue
+            catalog_ids[position] = by_isrc.get((track.get('isrc') or '').upper())
+            if catalog_ids[position]:
+                continue
+            query = f"{track['name']} {track['artist']}"
+            if query not in by_query:
+                by_query[query] = self._search_one(query)
+            catalog_ids[position] = by_query[query]
+        return catalog_ids
+
     def create_playlist(self, name):
         url = f"{self.base_url}/me/library/playlists"
         data = {"attributes": {"name": name}}
-        response = requests.post(url, json=data, headers=self.headers)
+        response = self._request("POST", "create_playlist", url, json=data)
         if response.status_code == 201:
             return response.json()['data'][0]['id']
         else:
             raise Exception(f"Failed to create playlist: {response.text}")
 
     def add_tracks(self, playlist_id, tracks):
-        # Simplified; real implementation needs catalog ID matching
-        added = 0
-        for track in tracks:
-            # Placeholder: assumes track exists in Apple Music
-            print(f"Simulating adding to Apple Music: {track['name']} by {track['artist']}")
-            added += 1
-        return added
+        results = self.add_tracks_detailed(playlist_id, tracks)
+        return sum(1 for result in results if result['status'] == "matched")
+
+    def add_tracks_detailed(self, playlist_id, tracks):
+        """Add tracks to a library playlist, reporting each one as matched, unmatched or failed
+
+        Catalog IDs are resolved in bulk, then added ADD_BATCH tracks per request.
+        """
+        catalog_ids = self.resolve_catalog_ids(tracks)
+        results = [
+            {"track": track, "apple_id": catalog_id, "status": "matched" if catalog_id else "unmatched"}
+            for track, catalog_id in zip(tracks, catalog_ids)
+        ]
+        matched = [result for result in results if result['status'] == "matched"]
+        url = f"{self.base_url}/me/library/playlists/{playlist_id}/tracks"
+        for i in range(0, len(matched), self.ADD_BATCH):
+            batch = matched[i:i + self.ADD_BATCH]
+            payload = {"data": [{"id": result['apple_id'], "type": "songs"} for result in batch]}
+            try:
+                response = self._request("POST", "add_tracks", url, json=payload)
+                failed = response.status_code not in (200, 201, 204)
+                if failed:
+                    print(f"Error adding tracks to Apple Music: {response.status_code} {response.text}")
+            except requests.RequestException as e:
+                print(f"Error adding tracks to Apple Music: {e}")
+                failed = True
+            if failed:
+                for result in batch:
+                    result['status'] = "failed"
+        return results
 
     # NEW FUNCTIONS
 
-    def analyze_playlist(self, playlist_id):
-        """Get detailed statistics about a playlist"""
+    def analyze_playlist(self, playlist_id, tracks=None):
+        """Get detailed statistics about a playlist, reusing its tracks if the caller already fetched them"""
         try:
             # Get playlist info
             playlist_url = f"{self.base_url}/me/library/playlists/{playlist_id}"
-            response = requests.get(playlist_url, headers=self.headers)
+            response = self._request("GET", "playlist", playlist_url)
             if response.status_code != 200:
                 raise Exception(f"Failed to get playlist info: {response.text}")
             
             playlist_info = response.json()['data'][0]
-            tracks = self.get_playlist_tracks(playlist_id)
+            if tracks is None:
+                tracks = self.get_playlist_tracks(playlist_id)
             
             # Calculate basic statistics
             stats = {
@@ -95,7 +243,7 @@ class AppleMusicClient:
             
             # Get playlist info
             playlist_url = f"{self.base_url}/me/library/playlists/{playlist_id}"
-            response = requests.get(playlist_url, headers=self.headers)
+            response = self._request("GET", "playlist", playlist_url)
             playlist_info = response.json()['data'][0] if response.status_code == 200 else {}
             
             if format == 'json':
@@ -135,24 +283,9 @@ class AppleMusicClient:
             return None
 
     def import_playlist(self, filename, playlist_name=None):
-        """Import playlist from JSON file"""
+        """Import playlist from a JSON, CSV or TXT export, adding tracks as they are read"""
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            
-            playlist_data = data.get('playlist', data)
-            tracks = playlist_data['tracks']
-            name = playlist_name or playlist_data.get('name', 'Imported Playlist')
-            
-            playlist_id = self.create_playlist(name)
-            added_count = self.add_tracks(playlist_id, tracks)
-            
-            return {
-                "playlist_id": playlist_id,
-                "name": name,
-                "tracks_added": added_count,
-                "total_tracks": len(tracks)
-            }
+            return import_into(self, filename, playlist_name)
         except Exception as e:
             print(f"Error importing playlist: {e}")
             return None
@@ -161,8 +294,11 @@ class AppleMusicClient:
         """Delete a playlist"""
         url = f"{self.base_url}/me/library/playlists/{playlist_id}"
         try:
-            response = requests.delete(url, headers=self.headers)
-            return response.status_code == 204
+            response = self._request("DELETE", "delete_playlist", url)
+            if response.status_code != 204:
+                return False
+            recommender.remove_playlist("apple_music", playlist_id)
+            return True
         except Exception as e:
             print(f"Error deleting playlist: {e}")
             return False
@@ -172,7 +308,7 @@ class AppleMusicClient:
         url = f"{self.base_url}/me/library/playlists/{playlist_id}"
         data = {"attributes": {"name": new_name}}
         try:
-            response = requests.patch(url, json=data, headers=self.headers)
+            response = self._request("PATCH", "rename_playlist", url, json=data)
             return response.status_code == 200
         except Exception as e:
             print(f"Error renaming playlist: {e}")
@@ -185,7 +321,7 @@ class AppleMusicClient:
             
             # Get original playlist name
             playlist_url = f"{self.base_url}/me/library/playlists/{playlist_id}"
-            response = requests.get(playlist_url, headers=self.headers)
+            response = self._request("GET", "playlist", playlist_url)
             original_name = "Unknown"
             if response.status_code == 200:
                 original_name = response.json()['data'][0]['attributes']['name']
@@ -205,15 +341,29 @@ class AppleMusicClient:
             return None
 
     def search_tracks(self, query, limit=20):
-        """Search for tracks in Apple Music catalog"""
-        url = f"{self.base_url}/catalog/us/search"
+        """Search for tracks in Apple Music catalog, answering from the search cache or the local library mirror when they can"""
+        cached = search_cache.get("apple_music", query, limit)
+        if cached is not None:
+            return cached
+        local = library_mirror.search(query, limit, ("apple_id", "duration_ms"))
+        if len(local) >= limit:
+            return [{
+                "id": row['apple_id'],
+                "apple_id": row['apple_id'],
+                "isrc": row['isrc'],
+                "name": row['name'],
+                "artist": row['artist'],
+                "album": row['album'],
+                "duration_ms": row['duration_ms']
+            } for row in local]
+        url = f"{self.base_url}/catalog/{self.storefront}/search"
         params = {
             "term": query,
             "types": "songs",
             "limit": limit
         }
         try:
-            response = requests.get(url, params=params, headers=self.headers)
+            response = self._request("GET", "search", url, params=params)
             if response.status_code != 200:
                 return []
             
@@ -222,11 +372,15 @@ class AppleMusicClient:
             for track in results.get('results', {}).get('songs', {}).get('data', []):
                 tracks.append({
                     "id": track['id'],
+                    "apple_id": track['id'],
+                    "isrc": track['attributes'].get('isrc'),
                     "name": track['attributes']['name'],
                     "artist": track['attributes']['artistName'],
                     "album": track['attributes'].get('albumName', ''),
                     "duration_ms": track['attributes'].get('durationInMillis', 0)
                 })
+            library_mirror.upsert(tracks)
+            search_cache.set("apple_music", query, limit, tracks)
             return tracks
         except Exception as e:
             print(f"Error searching tracks: {e}")
@@ -236,7 +390,7 @@ class AppleMusicClient:
         """Get all user playlists"""
         url = f"{self.base_url}/me/library/playlists"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._request("GET", "user_playlists", url)
             if response.status_code != 200:
                 return []
             
@@ -274,48 +428,54 @@ class AppleMusicClient:
 
     def backup_playlists(self, backup_dir="apple_playlist_backups"):
         """Backup all user playlists"""
-        import os
-        os.makedirs(backup_dir, exist_ok=True)
-        
         playlists = self.get_user_playlists()
-        backup_info = {
-            "backup_date": datetime.now().isoformat(),
-            "total_playlists": len(playlists),
-            "playlists": []
-        }
         
-        for playlist in playlists:
-            try:
-                tracks = self.get_playlist_tracks(playlist['id'])
-                playlist_data = {
-                    "id": playlist['id'],
-                    "name": playlist['name'],
-                    "tracks_count": len(tracks),
-                    "tracks": tracks
-                }
-                backup_info["playlists"].append(playlist_data)
-                
-                # Save individual playlist
-                filename = f"{backup_dir}/playlist_{playlist['id']}.json"
-                with open(filename, 'w') as f:
-                    json.dump(playlist_data, f, indent=2)
+        with progress.job("Apple Music backup", total=len(playlists)) as job, \
+                BackupWriter(backup_dir, len(playlists)) as writer:
+            for playlist in playlists:
+                try:
+                    job.set_phase(playlist['name'])
+                    tracks = self.get_playlist_tracks(playlist['id'])
+                    playlist_data = {
+                        "id": playlist['id'],
+                        "name": playlist['name'],
+                        "tracks_count": len(tracks),
+                        "tracks": tracks
+                    }
+                    writer.add(playlist_data)
+                    recommender.update_playlist("apple_music", playlist['id'], tracks)
                     
-            except Exception as e:
-                print(f"Error backing up playlist {playlist['name']}: {e}")
-        
-        # Save backup summary
-        summary_file = f"{backup_dir}/backup_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(summary_file, 'w') as f:
-            json.dump(backup_info, f, indent=2)
+                    # Save individual playlist
+                    filename = f"{backup_dir}/playlist_{playlist['id']}.json"
+                    with open(filename, 'w') as f:
+                        json.dump(playlist_data, f, indent=2)
+                    job.advance(tracks=len(tracks))
+                        
+                except Exception as e:
+                    print(f"Error backing up playlist {playlist['name']}: {e}")
+                    job.advance()
         
-        return summary_file
+            job.set_phase("saving recommendations")
+            recommender.save()
+        return writer.summary_file
 
     def get_playlist_recommendations(self, playlist_id, limit=20):
-        """Get recommendations based on a playlist"""
+        """Get recommendations based on a playlist
+
+        Answered from the local co-occurrence recommender (built from backups)
+        when it has data, falling back to a search for the top artist.
+        """
         try:
-            tracks = self.get_playlist_tracks(playlist_id)
+            tracks = recommender.playlist_tracks("apple_music", playlist_id)
+            if tracks is None:
+                tracks = self.get_playlist_tracks(playlist_id)
+                recommender.update_playlist("apple_music", playlist_id, tracks)
             if not tracks:
                 return []
+
+            recommendations = recommender.recommend(tracks, limit)
+            if recommendations:
+                return recommendations
             
             # Get top artists from playlist
             artist_counts = {}
@@ -0,0 +1,136 @@
+import heapq
+import math
+
+# Value ranges used to scale each feature to roughly 0..1 so no single feature dominates distances
+FEATURE_RANGES = {
+    "danceability": (0.0, 1.0),
+    "energy": (0.0, 1.0),
+    "valence": (0.0, 1.0),
+    "acousticness": (0.0, 1.0),
+    "instrumentalness": (0.0, 1.0),
+    "speechiness": (0.0, 1.0),
+    "liveness": (0.0, 1.0),
+    "tempo": (0.0, 250.0),
+    "loudness": (-60.0, 0.0),
+    "duration_ms": (0.0, 600000.0),
+    "key": (0.0, 11.0),
+    "mode": (0.0, 1.0)
+}
+DEFAULT_FIELDS = ("danceability", "energy", "valence", "tempo", "acousticness",
+                  "instrumentalness", "speechiness", "loudness")
+LEAF_SIZE = 16
+
+
+def _scale(field, value):
+    low, high = FEATURE_RANGES[field]
+    return (value - low) / (high - low)
+
+
+class AudioFeatureIndex:
+    """KD-tree over scaled audio-feature vectors for nearest-neighbor and range queries"""
+
+    def __init__(self, track_ids, vectors, fields=DEFAULT_FIELDS):
+        self.fields = tuple(fields)
+        self.track_ids = list(track_ids)
+        self.vectors = vectors
+        self._axis = {field: i for i, field in enumerate(self.fields)}
+        self._root = self._build(list(range(len(self.vectors))), 0) if self.vectors else None
+
+    @classmethod
+    def from_store(cls, store, fields=DEFAULT_FIELDS):
+        """Build an index over every track in an AudioFeatureStore"""
+        track_ids, matrix = store.matrix()
+        width = len(store.FIELDS)
+        columns = [store.FIELDS.index(field) for field in fields]
+        ids = []
+        vectors = []
+        for row, track_id in enumerate(track_ids):
+            base = row * width
+            values = [matrix[base + column] for column in columns]
+            if math.isnan(values[0]):
+                continue
+            ids.append(track_id)
+            vectors.append(tuple(_scale(field, value) for field, value in zip(fields, values)))
+        return cls(ids, vectors, fields)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _build(self, indices, depth):
+        if len(indices) <= LEAF_SIZE:
+            return indices
+        axis = depth % len(self.fields)
+        indices.sort(key=lambda i: self.vectors[i][axis])
+        middle = len(indices) // 2
+        split = self.vectors[indices[middle]][axis]
+        return (axis, split, self._build(indices[:middle], depth + 1), self._build(indices[middle:], depth + 1))
+
+    def _query_vector(self, target):
+        unknown = set(target) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Fields not in index: {', '.join(sorted(unknown))}")
+        return {self._axis[field]: _scale(field, value) for field, value in target.items()}
+
+    def nearest(self, target, k=20, allowed=None):
+        """Get the k tracks closest to a target profile ({feature: value}) as [(track_id, distance)]
+
+        allowed optionally restricts the result to a set of track IDs.
+        """
+        if self._root is None or k <= 0:
+            return []
+        query = self._query_vector(target)
+        best = []  # max-heap of (-distance, index)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            if isinstance(node, list):
+                for index in node:
+                    if allowed is not None and self.track_ids[index] not in allowed:
+                        continue
+                    vector = self.vectors[index]
+                    distance = sum((vector[axis] - value) ** 2 for axis, value in query.items())
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+                continue
+            axis, split, left, right = node
+            if axis not in query:
+                stack.append((left, bound))
+                stack.append((right, bound))
+                continue
+            gap = query[axis] - split
+            near, far = (left, right) if gap < 0 else (right, left)
+            stack.append((far, max(bound, gap * gap)))
+            stack.append((near, bound))
+        return [(self.track_ids[index], math.sqrt(-neg)) for neg, index in sorted(best, reverse=True)]
+
+    def within(self, ranges, limit=None):
+        """Get track IDs whose features all fall inside {feature: (low, high)}"""
+        if self._root is None:
+            return []
+        self._query_vector({field: 0 for field in ranges})
+        box = {}
+        for field, (low, high) in ranges.items():
+            box[self._axis[field]] = (_scale(field, low), _scale(field, high))
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                for index in node:
+                    vector = self.vectors[index]
+                    if all(low <= vector[axis] <= high for axis, (low, high) in box.items()):
+                        found.append(self.track_ids[index])
+                        if limit and len(found) >= limit:
+                            return found
+                continue
+            axis, split, left, right = node
+            low, high = box.get(axis, (-math.inf, math.inf))
+            if high >= split:
+                stack.append(right)
+            if low <= split:
+                stack.append(left)
+        return found
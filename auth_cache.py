@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+import time
+from cache import DiskCache
+from metrics import metrics
+
+
+def file_fingerprint(path):
+    """Identify a credentials file by path, size and modification time, so edits invalidate reuse"""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class SessionRegistry:
+    """Process-wide cache of authenticated API objects
+
+    A client created again in the same process (another menu session, a
+    scheduled run) reuses the API object and its pooled HTTP session, so
+    it skips credential loading and new TLS handshakes.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        with self._lock:
+            if key not in self._objects:
+                self._objects[key] = factory()
+            return self._objects[key]
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+
+class ProfileCache:
+    """User profiles stored on disk, keyed by a hash of the credential they belong to
+
+    Only the hash of the credential is stored, never the credential itself.
+    """
+
+    def __init__(self, name="auth", ttl=None):
+        self.name = name
+        self.ttl = ttl if ttl is not None else float(os.getenv("PLAYSYNC_PROFILE_TTL_DAYS", "30")) * 24 * 3600
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = DiskCache(self.name, ttl=self.ttl)
+        return self._store
+
+    @staticmethod
+    def _key(platform, credential):
+        return ["profile", platform, hashlib.sha256(credential.encode("utf-8")).hexdigest()]
+
+    def get(self, platform, credential):
+        if not credential:
+            return None
+        return self.store.get(self._key(platform, credential))
+
+    def set(self, platform, credential, profile):
+        if credential:
+            self.store.set(self._key(platform, credential), profile)
+
+
+class TokenRefresher(threading.Thread):
+    """Refreshes a spotipy OAuth token in the background before it expires
+
+    Requests then always find a valid token in the cache and never stop
+    to refresh it themselves.
+    """
+
+    def __init__(self, auth_manager, margin=300, retry_interval=30):
+        super().__init__(name="playsync-token-refresh", daemon=True)
+        self.auth_manager = auth_manager
+        self.margin = margin
+        self.retry_interval = retry_interval
+        self.refreshes = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            token = self.auth_manager.cache_handler.get_cached_token()
+            if not token or not token.get("refresh_token"):
+                # Nobody has logged in yet; check again once the login flow has stored a token
+                delay = self.retry_interval
+            else:
+                delay = token.get("expires_at", 0) - self.margin - time.time()
+                if delay <= 0:
+                    try:
+                        metrics.call("spotify", "token_refresh", self.auth_manager.refresh_access_token,
+                                     token["refresh_token"])
+                        self.refreshes += 1
+                    except Exception as e:
+                        print(f"Error refreshing Spotify token: {e}")
+                    delay = self.retry_interval
+            self._stop_event.wait(delay)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+sessions = SessionRegistry()
+profile_cache = ProfileCache()
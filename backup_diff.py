@@ -0,0 +1,101 @@
+from backups import BackupReader
+from sketches import track_key
+
+
+def _sorted_diff(old, new):
+    """Multiset difference of two sorted lists by a single merge pass, as (added, removed)"""
+    added, removed = [], []
+    i = j = 0
+    while i < len(old) and j < len(new):
+        if old[i] == new[j]:
+            i += 1
+            j += 1
+        elif old[i] < new[j]:
+            removed.append(old[i])
+            i += 1
+        else:
+            added.append(new[j])
+            j += 1
+    removed.extend(old[i:])
+    added.extend(new[j:])
+    return added, removed
+
+
+def _keyed_tracks(playlist):
+    tracks = {}
+    keys = []
+    for track in playlist.get('tracks', []):
+        key = track_key(track)
+        tracks.setdefault(key, track)
+        keys.append(key)
+    keys.sort()
+    return keys, tracks
+
+
+def _describe(track):
+    return {"name": track.get('name', ''), "artist": track.get('artist', ''), "album": track.get('album', '')}
+
+
+def diff_playlists(old_playlist, new_playlist):
+    """Track adds and removes between two versions of a playlist"""
+    old_keys, old_tracks = _keyed_tracks(old_playlist)
+    new_keys, new_tracks = _keyed_tracks(new_playlist)
+    added, removed = _sorted_diff(old_keys, new_keys)
+    return {
+        "added_tracks": [_describe(new_tracks[key]) for key in added],
+        "removed_tracks": [_describe(old_tracks[key]) for key in removed]
+    }
+
+
+def diff_backups(old_file, new_file):
+    """Compare two backup summaries without any API calls
+
+    Playlists are matched by ID with a sorted merge. Reports added, removed
+    and renamed playlists and, for playlists in both, the tracks added and
+    removed. Playlists whose stored JSON is byte-identical are skipped.
+    """
+    report = {
+        "old": {"file": old_file},
+        "new": {"file": new_file},
+        "added_playlists": [],
+        "removed_playlists": [],
+        "renamed_playlists": [],
+        "changed_playlists": [],
+        "unchanged_playlists": 0
+    }
+    with BackupReader(old_file) as old_reader, BackupReader(new_file) as new_reader:
+        report["old"]["backup_date"] = old_reader.backup_date
+        report["new"]["backup_date"] = new_reader.backup_date
+        old_ids = sorted(old_reader.playlist_ids())
+        new_ids = sorted(new_reader.playlist_ids())
+        i = j = 0
+        while i < len(old_ids) or j < len(new_ids):
+            old_id = old_ids[i] if i < len(old_ids) else None
+            new_id = new_ids[j] if j < len(new_ids) else None
+            if new_id is None or (old_id is not None and old_id < new_id):
+                entry = old_reader.index[old_id]
+                report["removed_playlists"].append({"id": old_id, "name": entry['name'], "tracks": entry['tracks_count']})
+                i += 1
+                continue
+            if old_id is None or new_id < old_id:
+                entry = new_reader.index[new_id]
+                report["added_playlists"].append({"id": new_id, "name": entry['name'], "tracks": entry['tracks_count']})
+                j += 1
+                continue
+            i += 1
+            j += 1
+            old_raw, new_raw = old_reader.raw(old_id), new_reader.raw(new_id)
+            if old_raw is not None and old_raw == new_raw:
+                report["unchanged_playlists"] += 1
+                continue
+            old_playlist, new_playlist = old_reader.get(old_id), new_reader.get(new_id)
+            if old_playlist.get('name') != new_playlist.get('name'):
+                report["renamed_playlists"].append(
+                    {"id": old_id, "old_name": old_playlist.get('name'), "new_name": new_playlist.get('name')}
+                )
+            changes = diff_playlists(old_playlist, new_playlist)
+            if changes["added_tracks"] or changes["removed_tracks"]:
+                report["changed_playlists"].append(dict({"id": new_id, "name": new_playlist.get('name')}, **changes))
+            elif old_playlist.get('name') == new_playlist.get('name'):
+                report["unchanged_playlists"] += 1
+    return report
@@ -0,0 +1,144 @@
+import json
+import mmap
+import os
+from datetime import datetime
+
+
+def index_path(summary_file):
+    """Path of the index written next to a backup summary"""
+    base, _ = os.path.splitext(summary_file)
+    return f"{base}.idx.json"
+
+
+class BackupWriter:
+    """Writes a backup summary one playlist at a time and indexes where each playlist sits
+
+    The summary keeps the usual layout ({"backup_date", "total_playlists",
+    "playlists": [...]}); the index maps each playlist ID to the byte offset
+    and length of its JSON object inside the summary.
+    """
+
+    def __init__(self, backup_dir, total_playlists):
+        os.makedirs(backup_dir, exist_ok=True)
+        self.backup_date = datetime.now().isoformat()
+        self.total_playlists = total_playlists
+        self.summary_file = f"{backup_dir}/backup_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        self._tmp_file = f"{self.summary_file}.tmp"
+        self._f = open(self._tmp_file, 'wb')
+        self._offset = 0
+        self._count = 0
+        self._index = {}
+        header = json.dumps({"backup_date": self.backup_date, "total_playlists": total_playlists}, indent=2)
+        self._write(header[:-2] + ',\n  "playlists": [')
+
+    def _write(self, text):
+        data = text.encode("utf-8")
+        self._f.write(data)
+        self._offset += len(data)
+
+    def add(self, playlist_data):
+        # ensure_ascii keeps the output ASCII; indenting the nested lines matches json.dump(indent=2)
+        body = json.dumps(playlist_data, indent=2).replace("\n", "\n    ")
+        self._write(("," if self._count else "") + "\n    ")
+        self._index[str(playlist_data['id'])] = {
+            "offset": self._offset,
+            "length": len(body),
+            "name": playlist_data.get('name', ''),
+            "tracks_count": len(playlist_data.get('tracks', []))
+        }
+        self._write(body)
+        self._count += 1
+
+    def close(self):
+        if self._f.closed:
+            return
+        self._write("\n  ]\n}" if self._count else "]\n}")
+        self._f.close()
+        os.replace(self._tmp_file, self.summary_file)
+        index = {
+            "summary": os.path.basename(self.summary_file),
+            "backup_date": self.backup_date,
+            "total_playlists": self.total_playlists,
+            "playlists": self._index
+        }
+        with open(index_path(self.summary_file), 'w') as f:
+            json.dump(index, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BackupReader:
+    """Random access to the playlists of a backup summary through its index and mmap
+
+    Only the pages holding a requested playlist are read. Summaries without
+    an index (older backups) are parsed in full instead.
+    """
+
+    def __init__(self, summary_file):
+        self.summary_file = summary_file
+        self._mmap = None
+        self._playlists = None
+        if os.path.exists(index_path(summary_file)):
+            with open(index_path(summary_file), 'r') as f:
+                index = json.load(f)
+            self.backup_date = index.get('backup_date')
+            self.total_playlists = index.get('total_playlists')
+            self.index = index['playlists']
+            if self.index:
+                with open(summary_file, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            with open(summary_file, 'r') as f:
+                backup = json.load(f)
+            self.backup_date = backup.get('backup_date')
+            self.total_playlists = backup.get('total_playlists')
+            self._playlists = {str(playlist['id']): playlist for playlist in backup.get('playlists', [])}
+            self.index = {
+                playlist_id: {"name": playlist.get('name', ''), "tracks_count": len(playlist.get('tracks', []))}
+                for playlist_id, playlist in self._playlists.items()
+            }
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, playlist_id):
+        return str(playlist_id) in self.index
+
+    def playlist_ids(self):
+        return list(self.index)
+
+    def get(self, playlist_id):
+        """Decode one playlist, or None if it is not in the backup"""
+        playlist_id = str(playlist_id)
+        if playlist_id not in self.index:
+            return None
+        if self._playlists is not None:
+            return self._playlists[playlist_id]
+        entry = self.index[playlist_id]
+        return json.loads(self._mmap[entry['offset']:entry['offset'] + entry['length']])
+
+    def raw(self, playlist_id):
+        """The stored JSON bytes of one playlist, or None for unindexed backups"""
+        entry = self.index.get(str(playlist_id))
+        if entry is None or self._mmap is None:
+            return None
+        return self._mmap[entry['offset']:entry['offset'] + entry['length']]
+
+    def __iter__(self):
+        for playlist_id in self.index:
+            yield self.get(playlist_id)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
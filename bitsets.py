@@ -0,0 +1,177 @@
+from sketches import track_key
+
+# Bits per chunk; empty chunks are not stored, so sparse playlists stay small
+CHUNK_BITS = 65536
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:
+    def _popcount(value):
+        return bin(value).count("1")
+
+
+class TrackInterner:
+    """Maps tracks to dense integer IDs by normalized name and artist"""
+
+    def __init__(self):
+        self._ids = {}
+        self._tracks = []
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def intern(self, track):
+        key = track_key(track)
+        track_id = self._ids.get(key)
+        if track_id is None:
+            track_id = self._ids[key] = len(self._tracks)
+            self._tracks.append(track)
+        return track_id
+
+    def lookup(self, track_id):
+        return self._tracks[track_id]
+
+
+class Bitmap:
+    """Chunked bitmap of integer IDs; set algebra runs as bitwise ops on Python ints"""
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, ids=(), chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+        if ids:
+            self._fill(ids)
+
+    def _fill(self, ids):
+        # Set bits in a byte buffer per chunk and convert once, instead of shifting a growing int per ID
+        buffers = {}
+        for track_id in ids:
+            chunk, bit = divmod(track_id, CHUNK_BITS)
+            buffer = buffers.get(chunk)
+            if buffer is None:
+                buffer = buffers[chunk] = bytearray(CHUNK_BITS // 8)
+            buffer[bit >> 3] |= 1 << (bit & 7)
+        for chunk, buffer in buffers.items():
+            self.chunks[chunk] = self.chunks.get(chunk, 0) | int.from_bytes(buffer, "little")
+
+    def add(self, track_id):
+        chunk, bit = divmod(track_id, CHUNK_BITS)
+        self.chunks[chunk] = self.chunks.get(chunk, 0) | (1 << bit)
+
+    def __contains__(self, track_id):
+        chunk, bit = divmod(track_id, CHUNK_BITS)
+        return bool(self.chunks.get(chunk, 0) >> bit & 1)
+
+    def __len__(self):
+        return sum(_popcount(value) for value in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        for chunk in sorted(self.chunks):
+            value = self.chunks[chunk]
+            base = chunk * CHUNK_BITS
+            while value:
+                low = value & -value
+                yield base + low.bit_length() - 1
+                value ^= low
+
+    def __and__(self, other):
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        chunks = {}
+        for chunk, value in small.chunks.items():
+            value &= large.chunks.get(chunk, 0)
+            if value:
+                chunks[chunk] = value
+        return Bitmap(chunks=chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for chunk, value in other.chunks.items():
+            chunks[chunk] = chunks.get(chunk, 0) | value
+        return Bitmap(chunks=chunks)
+
+    def __sub__(self, other):
+        chunks = {}
+        for chunk, value in self.chunks.items():
+            value &= ~other.chunks.get(chunk, 0)
+            if value:
+                chunks[chunk] = value
+        return Bitmap(chunks=chunks)
+
+    def __xor__(self, other):
+        chunks = dict(self.chunks)
+        for chunk, value in other.chunks.items():
+            value ^= chunks.get(chunk, 0)
+            if value:
+                chunks[chunk] = value
+            else:
+                chunks.pop(chunk, None)
+        return Bitmap(chunks=chunks)
+
+    def intersection_count(self, other):
+        """Size of the intersection without building it"""
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        return sum(_popcount(value & large.chunks.get(chunk, 0)) for chunk, value in small.chunks.items())
+
+    @staticmethod
+    def intersect_all(bitmaps):
+        bitmaps = sorted(bitmaps, key=lambda bitmap: len(bitmap.chunks))
+        if not bitmaps:
+            return Bitmap()
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result = result & bitmap
+            if not result:
+                break
+        return result
+
+    @staticmethod
+    def union_all(bitmaps):
+        chunks = {}
+        for bitmap in bitmaps:
+            for chunk, value in bitmap.chunks.items():
+                chunks[chunk] = chunks.get(chunk, 0) | value
+        return Bitmap(chunks=chunks)
+
+
+class PlaylistSets:
+    """Playlists as bitmaps over one shared track universe, for N-way comparison"""
+
+    def __init__(self):
+        self.interner = TrackInterner()
+        self.bitmaps = {}
+
+    def add(self, name, tracks):
+        self.bitmaps[name] = Bitmap([self.interner.intern(track) for track in tracks])
+
+    def common(self):
+        """Tracks in every playlist"""
+        return Bitmap.intersect_all(self.bitmaps.values())
+
+    def union(self):
+        return Bitmap.union_all(self.bitmaps.values())
+
+    def unique(self, name):
+        """Tracks only in the named playlist"""
+        others = Bitmap.union_all(bitmap for other, bitmap in self.bitmaps.items() if other != name)
+        return self.bitmaps[name] - others
+
+    def select(self, include=(), exclude=()):
+        """Tracks in every included playlist and in none of the excluded ones"""
+        result = Bitmap.intersect_all(self.bitmaps[name] for name in include) if include else self.union()
+        if exclude:
+            result = result - Bitmap.union_all(self.bitmaps[name] for name in exclude)
+        return result
+
+    def pair_overlaps(self):
+        """Shared track counts for every pair of playlists as {(a, b): count}"""
+        names = list(self.bitmaps)
+        return {
+            (a, b): self.bitmaps[a].intersection_count(self.bitmaps[b])
+            for i, a in enumerate(names) for b in names[i + 1:]
+        }
+
+    def tracks(self, bitmap):
+        return [self.interner.lookup(track_id) for track_id in bitmap]
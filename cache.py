@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_dir(name):
+    """Get (and create) a named directory under the PlaySync cache root"""
+    path = os.path.join(os.getenv("PLAYSYNC_CACHE_DIR", ".playsync_cache"), name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl=60, maxsize=128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._data)}
+
+
+def content_hash(data):
+    """Stable hash of JSON-serializable data, used as a version for unversioned playlists"""
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """JSON values stored one file per key under the cache directory"""
+
+    def __init__(self, name, ttl=None):
+        self.directory = cache_dir(name)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            item = None
+        if item is not None and self.ttl is not None and item["stored_at"] + self.ttl < time.time():
+            item = None
+        with self._lock:
+            if item is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return item["value"]
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"stored_at": time.time(), "value": value}, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def prune(self, max_entries=None):
+        """Delete expired entries, then the least recently written ones beyond max_entries"""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        entries.sort()
+        now = time.time()
+        removed, keep = [], []
+        for mtime, path in entries:
+            (keep if self.ttl is None or mtime + self.ttl >= now else removed).append(path)
+        if max_entries is not None and len(keep) > max_entries:
+            removed.extend(keep[:len(keep) - max_entries])
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(removed)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
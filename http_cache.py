@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+from cache import cache_dir
+
+
+class HTTPCache:
+    """Size-bounded disk cache of GET responses, revalidated with ETag/Last-Modified"""
+
+    def __init__(self, name="http", max_bytes=64 * 1024 * 1024):
+        self.directory = cache_dir(name)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._total_bytes = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                self._index[entry.name[:-5]] = (stat.st_size, stat.st_mtime)
+                self._total_bytes += stat.st_size
+
+    @staticmethod
+    def _key(url, params=None):
+        raw = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def lookup(self, url, params=None):
+        """Get the stored entry for a request, or None"""
+        key = self._key(url, params)
+        if key not in self._index:
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            self._forget(key)
+            return None
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Build the revalidation headers for a stored entry"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, params, response):
+        """Store a 200 response that carries a validator"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+        key = self._key(url, params)
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": response.headers.get("Content-Type", "application/json"),
+            "body": response.content.decode("utf-8", errors="replace")
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            old_size = self._index.get(key, (0, 0))[0]
+            self._index[key] = (size, time.time())
+            self._total_bytes += size - old_size
+        self._evict()
+
+    def revalidated(self, url, params, entry):
+        """Turn a 304 into a response carrying the stored body"""
+        key = self._key(url, params)
+        now = time.time()
+        try:
+            os.utime(self._path(key), (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._index:
+                self._index[key] = (self._index[key][0], now)
+            self.hits += 1
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = entry["body"].encode("utf-8")
+        response.headers = CaseInsensitiveDict({"Content-Type": entry.get("content_type", "application/json")})
+        if entry.get("etag"):
+            response.headers["ETag"] = entry["etag"]
+        if entry.get("last_modified"):
+            response.headers["Last-Modified"] = entry["last_modified"]
+        return response
+
+    def _forget(self, key):
+        with self._lock:
+            size = self._index.pop(key, (0, 0))[0]
+            self._total_bytes -= size
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            victims = []
+            for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                victims.append(key)
+                self._total_bytes -= size
+                del self._index[key]
+            self.evictions += len(victims)
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, send, url, params=None, headers=None):
+        """Send a conditional GET through send() and return a response with the current body"""
+        entry = self.lookup(url, params)
+        request_headers = dict(headers or {})
+        request_headers.update(self.conditional_headers(entry))
+        response = send(url, params=params, headers=request_headers)
+        if response.status_code == 304 and entry is not None:
+            return self.revalidated(url, params, entry)
+        with self._lock:
+            self.misses += 1
+        self.store(url, params, response)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total_bytes
+            }
@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import re
+
+IMPORT_CHUNK = 200
+BLOCK_SIZE = 64 * 1024
+
+_CSV_COLUMNS = {"track name": "name", "name": "name", "title": "name", "artist": "artist", "album": "album"}
+_TXT_TRACK = re.compile(r"^\d+\. (?P<name>.*) - (?P<artist>.*?) \((?P<album>.*)\)$")
+_decoder = json.JSONDecoder()
+
+
+class _JSONReader:
+    """Pulls JSON values out of a file one at a time, keeping only a small buffer in memory"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        # Read at least as much as is buffered so re-parsing a large value stays linear overall
+        data = self.f.read(max(BLOCK_SIZE, len(self.buffer) - self.position))
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ""
+
+    def take(self, expected):
+        found = self.peek()
+        if found not in expected:
+            raise ValueError(f"Invalid JSON: expected {expected!r} but found {found!r}")
+        self.position += 1
+        return found
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next block
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.position = end
+            return value
+
+
+def _json_events(reader):
+    """Yield ("name", value) and ("track", dict) events from a playlist export or backup file"""
+    if reader.peek() == "[":
+        reader.take("[")
+        yield from _json_array(reader)
+        return
+    reader.take("{")
+    yield from _json_members(reader, top=True)
+
+
+def _json_members(reader, top):
+    if reader.peek() == "}":
+        reader.take("}")
+        return
+    while True:
+        key = reader.value()
+        reader.take(":")
+        if key == "playlist" and top and reader.peek() == "{":
+            reader.take("{")
+            yield from _json_members(reader, top=False)
+        elif key == "tracks" and reader.peek() == "[":
+            reader.take("[")
+            yield from _json_array(reader)
+        else:
+            value = reader.value()
+            if key == "name":
+                yield ("name", value)
+        if reader.take(",}") == "}":
+            return
+
+
+def _json_array(reader):
+    if reader.peek() == "]":
+        reader.take("]")
+        return
+    while True:
+        yield ("track", reader.value())
+        if reader.take(",]") == "]":
+            return
+
+
+def _csv_events(f):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if not header:
+        return
+    fields = [_CSV_COLUMNS.get(column.strip().lower(), column.strip().lower()) for column in header]
+    for row in reader:
+        if row:
+            track = dict(zip(fields, row))
+            track.setdefault("album", "")
+            yield ("track", track)
+
+
+def _txt_events(f):
+    for line in f:
+        line = line.rstrip("\n")
+        if line.startswith("Playlist: "):
+            yield ("name", line[len("Playlist: "):])
+            continue
+        match = _TXT_TRACK.match(line)
+        if match:
+            yield ("track", match.groupdict())
+
+
+class PlaylistImport:
+    """A playlist file (JSON, CSV or TXT export) read incrementally
+
+    name is filled in as soon as the parser reaches it, which for exports
+    written by this tool is before the first track.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.name = None
+        extension = os.path.splitext(filename)[1].lower()
+        self.format = extension[1:] if extension in (".json", ".csv", ".txt") else "json"
+
+    def tracks(self):
+        with open(self.filename, 'r', encoding='utf-8', newline='' if self.format == "csv" else None) as f:
+            if self.format == "csv":
+                events = _csv_events(f)
+            elif self.format == "txt":
+                events = _txt_events(f)
+            else:
+                events = _json_events(_JSONReader(f))
+            for kind, value in events:
+                if kind == "name":
+                    self.name = self.name or value
+                elif isinstance(value, dict) and value.get("name"):
+                    yield value
+
+    def chunks(self, size=IMPORT_CHUNK):
+        chunk = []
+        for track in self.tracks():
+            chunk.append(track)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def import_into(client, filename, playlist_name=None, chunk_size=IMPORT_CHUNK):
+    """Stream a playlist file into a new playlist, writing each chunk as soon as it is parsed"""
+    playlist_import = PlaylistImport(filename)
+    playlist_id = None
+    name = playlist_name
+    added_count = 0
+    total_tracks = 0
+    for chunk in playlist_import.chunks(chunk_size):
+        if playlist_id is None:
+            name = playlist_name or playlist_import.name or 'Imported Playlist'
+            playlist_id = client.create_playlist(name)
+        added_count += client.add_tracks(playlist_id, chunk)
+        total_tracks += len(chunk)
+    if playlist_id is None:
+        name = playlist_name or playlist_import.name or 'Imported Playlist'
+        playlist_id = client.create_playlist(name)
+    return {
+        "playlist_id": playlist_id,
+        "name": name,
+        "tracks_added": added_count,
+        "total_tracks": total_tracks
+    }
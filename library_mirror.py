@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+from cache import cache_dir
+from sketches import track_key
+
+ID_FIELDS = ("spotify_id", "apple_id", "youtube_id")
+_COLUMNS = ("key", "name", "artist", "album", "isrc") + ID_FIELDS + ("duration_ms", "popularity", "updated_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    key TEXT PRIMARY KEY, name TEXT, artist TEXT, album TEXT, isrc TEXT,
+    spotify_id TEXT, apple_id TEXT, youtube_id TEXT,
+    duration_ms INTEGER, popularity INTEGER, updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tracks_isrc ON tracks(isrc);
+CREATE INDEX IF NOT EXISTS tracks_spotify_id ON tracks(spotify_id);
+CREATE INDEX IF NOT EXISTS tracks_apple_id ON tracks(apple_id);
+CREATE INDEX IF NOT EXISTS tracks_youtube_id ON tracks(youtube_id);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(name, artist, album, content='tracks', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, name, artist, album) VALUES (new.rowid, new.name, new.artist, new.album);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, name, artist, album) VALUES ('delete', old.rowid, old.name, old.artist, old.album);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF name, artist, album ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, name, artist, album) VALUES ('delete', old.rowid, old.name, old.artist, old.album);
+    INSERT INTO tracks_fts(rowid, name, artist, album) VALUES (new.rowid, new.name, new.artist, new.album);
+END;
+"""
+
+# Keep known IDs when a listing from another platform (which lacks them) is upserted
+_UPSERT = f"""
+INSERT INTO tracks ({", ".join(_COLUMNS)}) VALUES ({", ".join("?" * len(_COLUMNS))})
+ON CONFLICT(key) DO UPDATE SET
+    album = CASE WHEN excluded.album != '' THEN excluded.album ELSE tracks.album END,
+    isrc = COALESCE(excluded.isrc, tracks.isrc),
+    spotify_id = COALESCE(excluded.spotify_id, tracks.spotify_id),
+    apple_id = COALESCE(excluded.apple_id, tracks.apple_id),
+    youtube_id = COALESCE(excluded.youtube_id, tracks.youtube_id),
+    duration_ms = COALESCE(excluded.duration_ms, tracks.duration_ms),
+    popularity = COALESCE(excluded.popularity, tracks.popularity),
+    updated_at = excluded.updated_at
+"""
+
+
+class LibraryMirror:
+    """Local SQLite mirror of every track seen on any platform
+
+    Rows are keyed by normalized name/artist and merge the platform IDs and
+    ISRC seen for that track, so searches and matches can be answered
+    locally. Full-text search uses FTS5 when SQLite has it, LIKE otherwise.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.fts = False
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self.path = self.path or os.path.join(cache_dir("mirror"), "library.sqlite3")
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            with conn:
+                conn.executescript(_SCHEMA)
+                try:
+                    conn.executescript(_FTS_SCHEMA)
+                    self.fts = True
+                except sqlite3.OperationalError:
+                    self.fts = False
+            self._conn = conn
+        return self._conn
+
+    def upsert(self, tracks):
+        """Add or refresh tracks from a listing or search result"""
+        now = time.time()
+        rows = []
+        for track in tracks:
+            if not track.get('name'):
+                continue
+            isrc = track.get('isrc')
+            rows.append((
+                track_key(track), track['name'], track.get('artist', ''), track.get('album') or '',
+                isrc.upper() if isrc else None,
+                track.get('spotify_id'), track.get('apple_id'), track.get('youtube_id'),
+                track.get('duration_ms'), track.get('popularity'), now
+            ))
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(_UPSERT, rows)
+
+    def resolve(self, tracks, id_field):
+        """Look up a platform ID (e.g. "spotify_id") for each track locally, by ISRC then name/artist"""
+        isrcs = {track['isrc'].upper() for track in tracks if track.get('isrc')}
+        keys = {track_key(track) for track in tracks}
+        by_isrc, by_key = {}, {}
+        with self._lock:
+            conn = self._connection()
+            for column, values, found in (("isrc", list(isrcs), by_isrc), ("key", list(keys), by_key)):
+                for i in range(0, len(values), 500):
+                    chunk = values[i:i + 500]
+                    rows = conn.execute(
+                        f"SELECT {column}, {id_field} FROM tracks "
+                        f"WHERE {id_field} IS NOT NULL AND {column} IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    )
+                    for value, platform_id in rows:
+                        found.setdefault(value, platform_id)
+        resolved = []
+        for track in tracks:
+            platform_id = by_isrc.get((track.get('isrc') or '').upper()) or by_key.get(track_key(track))
+            resolved.append(platform_id)
+        with self._lock:
+            hits = sum(1 for platform_id in resolved if platform_id)
+            self.hits += hits
+            self.misses += len(resolved) - hits
+        return resolved
+
+    def search(self, query, limit=20, required=()):
+        """Full-text search over name, artist and album
+
+        required lists columns (e.g. "spotify_id") that must be known for a
+        row to be returned, so callers only get rows they can use as-is.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        extra = "".join(f" AND t.{column} IS NOT NULL" for column in required)
+        with self._lock:
+            conn = self._connection()
+            if self.fts:
+                match = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+                rows = conn.execute(
+                    f"SELECT t.* FROM tracks_fts f JOIN tracks t ON t.rowid = f.rowid "
+                    f"WHERE tracks_fts MATCH ?{extra} ORDER BY f.rank LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+            else:
+                condition = " AND ".join("(t.name LIKE ? OR t.artist LIKE ? OR t.album LIKE ?)" for _ in terms)
+                params = [f"%{term}%" for term in terms for _ in range(3)]
+                rows = conn.execute(
+                    f"SELECT t.* FROM tracks t WHERE {condition}{extra} LIMIT ?", params + [limit]
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            count = conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            return {"tracks": count, "fts": self.fts, "hits": self.hits, "misses": self.misses}
+
+
+library_mirror = LibraryMirror()
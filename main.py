@@ -1,7 +1,27 @@
+import argparse
+import atexit
+import functools
+import json
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from spotify_client import SpotifyClient
 from apple_client import AppleMusicClient
 from youtube_client import YouTubeMusicClient
 from utils import PlaylistUtils
+from metrics import metrics
+from profiler import profiler, profiled
+from analysis_cache import analysis_cache
+from search_cache import search_cache
+from track_filters import compile_filter, FilterSyntaxError
+from bitsets import PlaylistSets
+from backup_diff import diff_backups
+from progress import progress, TerminalRenderer, JSONLinesSink
+from scheduler import Scheduler
+
+def run_profiled(name, func, *args, **kwargs):
+    """Run one dispatched operation, profiled as an action now that its prompts are answered"""
+    return profiled(name)(func)(*args, **kwargs)
 
 def get_tracks(source_client, source_type, source_id):
     if source_type == "Spotify":
@@ -12,47 +32,87 @@ def get_tracks(source_client, source_type, source_id):
         return source_client.get_playlist_tracks(source_id)
     return []
 
+def fan_out(tasks):
+    """Run {platform: callable} concurrently, isolating failures per platform
+
+    Returns (results, errors), both keyed by platform.
+    """
+    results, errors = {}, {}
+    if not tasks:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {executor.submit(task): platform for platform, task in tasks.items()}
+        for future in as_completed(futures):
+            platform = futures[future]
+            try:
+                results[platform] = future.result()
+            except Exception as e:
+                errors[platform] = e
+                print(f"Error with {platform}: {e}")
+    return results, errors
+
+def fetch_all_tracks(clients, sources):
+    """Fetch each source playlist concurrently; failed platforms are left out"""
+    tasks = {
+        source_type: functools.partial(get_tracks, clients[source_type], source_type, source_id)
+        for source_type, source_id in sources.items()
+    }
+    results, _ = fan_out(tasks)
+    # Keep the order the sources were given in
+    return {source_type: results[source_type] for source_type in sources if source_type in results}
+
 def add_to_target(target_client, target_type, playlist_name, tracks):
     playlist_id = target_client.create_playlist(playlist_name)
     added_count = target_client.add_tracks(playlist_id, tracks)
     print(f"Added {added_count} tracks to {target_type} playlist: {playlist_name}")
     return playlist_id
 
-def convert_playlist(source_client, source_type, target_clients, source_id):
+@profiled()
+def convert_playlist(source_client, source_type, target_clients, source_id, target_name):
     tracks = get_tracks(source_client, source_type, source_id)
     print(f"Retrieved {len(tracks)} tracks from {source_type}.")
-    target_name = input(f"Enter name for new playlist(s): ")
-    for target_client, target_type in target_clients.items():
-        add_to_target(target_client, target_type, target_name, tracks)
-
-def merge_playlists(clients, sources):
-    all_tracks = set()
-    for source_type, source_id in sources.items():
-        tracks = get_tracks(clients[source_type], source_type, source_id)
+    profiler.tag(tracks=len(tracks))
+    fan_out({
+        target_type: functools.partial(add_to_target, target_client, target_type, target_name, tracks)
+        for target_type, target_client in target_clients.items()
+    })
+
+@profiled()
+def merge_playlists(clients, sources, target_type, target_name):
+    all_tracks = {}
+    for tracks in fetch_all_tracks(clients, sources).values():
         for track in tracks:
-            all_tracks.add((track['name'], track['artist']))
-    merged_tracks = [{"name": t[0], "artist": t[1], "album": ""} for t in all_tracks]
+            # Keep the first full listing so its ISRC and platform IDs carry over to the target
+            all_tracks.setdefault((track['name'], track['artist']), track)
+    merged_tracks = list(all_tracks.values())
     print(f"Merged into {len(merged_tracks)} unique tracks.")
-    target_type = input("Enter target platform (Spotify, Apple Music, YouTube Music): ")
-    target_name = input("Enter name for merged playlist: ")
+    profiler.tag(tracks=len(merged_tracks))
     add_to_target(clients[target_type], target_type, target_name, merged_tracks)
 
+@profiled()
 def compare_playlists(clients, sources):
-    track_sets = {}
-    for source_type, source_id in sources.items():
-        tracks = get_tracks(clients[source_type], source_type, source_id)
-        track_sets[source_type] = {(t['name'], t['artist']) for t in tracks}
+    playlist_sets = PlaylistSets()
+    for source_type, tracks in fetch_all_tracks(clients, sources).items():
+        playlist_sets.add(source_type, tracks)
+    if len(playlist_sets.bitmaps) < 2:
+        print("Need at least 2 playlists to compare.")
+        return
     
-    common = set.intersection(*track_sets.values())
+    common = playlist_sets.common()
     print(f"\nCommon tracks across all playlists ({len(common)}):")
-    for track in common:
-        print(f"- {track[0]} by {track[1]}")
+    for track in playlist_sets.tracks(common):
+        print(f"- {track['name']} by {track['artist']}")
     
-    for source_type, tracks in track_sets.items():
-        unique = tracks - common
+    for source_type in playlist_sets.bitmaps:
+        unique = playlist_sets.unique(source_type)
         print(f"\nUnique to {source_type} ({len(unique)}):")
-        for track in unique:
-            print(f"- {track[0]} by {track[1]}")
+        for track in playlist_sets.tracks(unique):
+            print(f"- {track['name']} by {track['artist']}")
+    
+    if len(playlist_sets.bitmaps) > 2:
+        print("\nShared tracks per pair:")
+        for (a, b), count in playlist_sets.pair_overlaps().items():
+            print(f"- {a} & {b}: {count}")
 
 def analyze_playlist_menu(clients):
     """Menu for playlist analysis functions"""
@@ -61,18 +121,19 @@ def analyze_playlist_menu(clients):
     print("2. Analyze multiple playlists")
     print("3. Compare audio features across playlists")
     print("4. Generate comprehensive report")
-    print("5. Back to main menu")
+    print("5. Find similar playlists across library")
+    print("6. Back to main menu")
     
-    choice = input("Enter your choice (1-5): ")
+    choice = input("Enter your choice (1-6): ")
     
     if choice == "1":
         platform = input("Platform (Spotify, Apple Music, YouTube Music): ")
         if platform == "Spotify":
             playlist_url = input("Enter Spotify playlist URL: ")
-            stats = clients[platform].analyze_playlist(playlist_url)
+            stats = run_profiled("analyze_playlist", clients[platform].analyze_playlist, playlist_url)
         else:
             playlist_id = input(f"Enter {platform} playlist ID: ")
-            stats = clients[platform].analyze_playlist(playlist_id)
+            stats = run_profiled("analyze_playlist", clients[platform].analyze_playlist, playlist_id)
         
         if stats:
             print(f"\n=== {stats['name']} Analysis ===")
@@ -167,6 +228,25 @@ def analyze_playlist_menu(clients):
             format_choice = input("Report format (json/csv): ").lower()
             filename = PlaylistUtils.generate_playlist_report(results, format_choice)
             print(f"Report saved as: {filename}")
+            cache_stats = analysis_cache.stats()
+            print(f"Analysis cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                  f"({cache_stats['hit_ratio']:.0%} hit ratio)")
+
+    elif choice == "5":
+        threshold = input("Minimum overlap (Jaccard, 0-1, default 0.5): ")
+        threshold = float(threshold) if threshold else 0.5
+        results = PlaylistUtils.find_similar_playlists(clients, threshold)
+        print(f"\nCompared {results['playlists_compared']} playlists.")
+        print(f"\n=== Similar Pairs ({len(results['pairs'])}) ===")
+        for pair in results['pairs']:
+            print(f"- {pair['a']['name']} ({pair['a']['platform']}) ~ {pair['b']['name']} ({pair['b']['platform']}): "
+                  f"{pair['jaccard']:.0%} overlap")
+        if results['clusters']:
+            print("\n=== Clusters ===")
+            for i, cluster in enumerate(results['clusters'], 1):
+                print(f"{i}. " + ", ".join(f"{p['name']} ({p['platform']})" for p in cluster))
+        for error in results['errors']:
+            print(f"Error with {error['platform']}: {error['error']}")
 
 def export_import_menu(clients):
     """Menu for export/import functions"""
@@ -185,10 +265,10 @@ def export_import_menu(clients):
         
         if platform == "Spotify":
             playlist_url = input("Enter Spotify playlist URL: ")
-            filename = clients[platform].export_playlist(playlist_url, format_choice)
+            filename = run_profiled("export_playlist", clients[platform].export_playlist, playlist_url, format_choice)
         else:
             playlist_id = input(f"Enter {platform} playlist ID: ")
-            filename = clients[platform].export_playlist(playlist_id, format_choice)
+            filename = run_profiled("export_playlist", clients[platform].export_playlist, playlist_id, format_choice)
         
         if filename:
             print(f"Playlist exported to: {filename}")
@@ -201,7 +281,7 @@ def export_import_menu(clients):
         if not playlist_name:
             playlist_name = None
         
-        result = clients[platform].import_playlist(filename, playlist_name)
+        result = run_profiled("import_playlist", clients[platform].import_playlist, filename, playlist_name)
         if result:
             print(f"Playlist imported: {result['name']} with {result['tracks_added']} tracks")
     
@@ -240,7 +320,7 @@ def export_import_menu(clients):
         if not backup_dir:
             backup_dir = None
         
-        filename = clients[platform].backup_playlists(backup_dir)
+        filename = run_profiled("backup_playlists", clients[platform].backup_playlists, backup_dir)
         print(f"Backup completed: {filename}")
 
 def playlist_management_menu(clients):
@@ -256,7 +336,7 @@ def playlist_management_menu(clients):
     
     if choice == "1":
         platform = input("Platform (Spotify, Apple Music, YouTube Music): ")
-        playlists = clients[platform].get_user_playlists()
+        playlists = run_profiled("get_user_playlists", clients[platform].get_user_playlists)
         print(f"\n=== {platform} Playlists ===")
         for playlist in playlists:
             print(f"- {playlist['name']} ({playlist['tracks_count']} tracks)")
@@ -265,10 +345,10 @@ def playlist_management_menu(clients):
         platform = input("Platform (Spotify, Apple Music, YouTube Music): ")
         if platform == "Spotify":
             playlist_url = input("Enter Spotify playlist URL: ")
-            success = clients[platform].delete_playlist(playlist_url)
+            success = run_profiled("delete_playlist", clients[platform].delete_playlist, playlist_url)
         else:
             playlist_id = input(f"Enter {platform} playlist ID: ")
-            success = clients[platform].delete_playlist(playlist_id)
+            success = run_profiled("delete_playlist", clients[platform].delete_playlist, playlist_id)
         
         if success:
             print("Playlist deleted successfully")
@@ -281,10 +361,10 @@ def playlist_management_menu(clients):
         
         if platform == "Spotify":
             playlist_url = input("Enter Spotify playlist URL: ")
-            success = clients[platform].rename_playlist(playlist_url, new_name)
+            success = run_profiled("rename_playlist", clients[platform].rename_playlist, playlist_url, new_name)
         else:
             playlist_id = input(f"Enter {platform} playlist ID: ")
-            success = clients[platform].rename_playlist(playlist_id, new_name)
+            success = run_profiled("rename_playlist", clients[platform].rename_playlist, playlist_id, new_name)
         
         if success:
             print("Playlist renamed successfully")
@@ -300,10 +380,10 @@ def playlist_management_menu(clients):
         
         if platform == "Spotify":
             playlist_url = input("Enter Spotify playlist URL: ")
-            result = clients[platform].duplicate_playlist(playlist_url, new_name)
+            result = run_profiled("duplicate_playlist", clients[platform].duplicate_playlist, playlist_url, new_name)
         else:
             playlist_id = input(f"Enter {platform} playlist ID: ")
-            result = clients[platform].duplicate_playlist(playlist_id, new_name)
+            result = run_profiled("duplicate_playlist", clients[platform].duplicate_playlist, playlist_id, new_name)
         
         if result:
             print(f"Playlist duplicated: {result['name']} with {result['tracks_added']} tracks")
@@ -316,16 +396,17 @@ def search_recommendations_menu(clients):
     print("3. Get track recommendations")
     print("4. Create playlist from recommendations")
     print("5. Create smart playlist")
-    print("6. Back to main menu")
+    print("6. Create playlist from audio profile")
+    print("7. Back to main menu")
     
-    choice = input("Enter your choice (1-6): ")
+    choice = input("Enter your choice (1-7): ")
     
     if choice == "1":
         platform = input("Platform (Spotify, Apple Music, YouTube Music): ")
         query = input("Search query: ")
         limit = int(input("Number of results (default 20): ") or "20")
         
-        tracks = clients[platform].search_tracks(query, limit)
+        tracks = run_profiled("search_tracks", clients[platform].search_tracks, query, limit)
         print(f"\n=== Search Results ({len(tracks)} tracks) ===")
         for i, track in enumerate(tracks, 1):
             print(f"{i}. {track['name']} - {track['artist']}")
@@ -336,7 +417,7 @@ def search_recommendations_menu(clients):
         playlist_name = input("Playlist name: ")
         limit = int(input("Number of tracks (default 20): ") or "20")
         
-        result = clients[platform].create_playlist_from_search(query, playlist_name, limit)
+        result = run_profiled("create_playlist_from_search", clients[platform].create_playlist_from_search, query, playlist_name, limit)
         if result:
             print(f"Playlist created: {result['name']} with {result['tracks_added']} tracks")
     
@@ -344,10 +425,10 @@ def search_recommendations_menu(clients):
         platform = input("Platform (Spotify, Apple Music, YouTube Music): ")
         if platform == "Spotify":
             track_id = input("Enter Spotify track ID: ")
-            recommendations = clients[platform].get_recommendations(seed_tracks=[track_id])
+            recommendations = run_profiled("get_recommendations", clients[platform].get_recommendations, seed_tracks=[track_id])
         else:
             playlist_id = input(f"Enter {platform} playlist ID: ")
-            recommendations = clients[platform].get_playlist_recommendations(playlist_id)
+            recommendations = run_profiled("get_playlist_recommendations", clients[platform].get_playlist_recommendations, playlist_id)
         
         print(f"\n=== Recommendations ({len(recommendations)} tracks) ===")
         for i, track in enumerate(recommendations, 1):
@@ -381,6 +462,14 @@ def search_recommendations_menu(clients):
         
         filters = {}
         if input("Apply filters? (y/n): ").lower() == 'y':
+            expression = input("Filter expression, e.g. popularity >= 60 and duration_ms < 240000 (or press Enter for guided filters): ")
+            if expression:
+                try:
+                    compile_filter(expression)
+                    filters['expression'] = expression
+                except FilterSyntaxError as e:
+                    print(f"Invalid filter expression, ignoring it: {e}")
+            
             min_pop = input("Minimum popularity (0-100, or press Enter to skip): ")
             if min_pop:
                 filters['min_popularity'] = int(min_pop)
@@ -398,6 +487,44 @@ def search_recommendations_menu(clients):
         result = PlaylistUtils.create_smart_playlist(clients, criteria, target_platform, playlist_name)
         if result:
             print(f"Smart playlist created: {result['name']} with {result['tracks_added']} tracks")
+        cache_stats = search_cache.stats()
+        print(f"Search cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_ratio']:.0%} hit ratio)")
+    
+    elif choice == "6":
+        print("Audio profile (features: danceability, energy, valence, tempo, acousticness, instrumentalness, speechiness, loudness)")
+        target = input("Target profile, e.g. energy=0.8, tempo=128 (or press Enter to skip): ")
+        ranges = input("Ranges, e.g. energy=0.6:1.0, tempo=110:140 (or press Enter to skip): ")
+        search_query = input("Search query to add candidates from (or press Enter to use your library only): ")
+        target_platform = input("Target platform (Spotify, Apple Music, YouTube Music): ")
+        playlist_name = input("Playlist name: ")
+        limit = int(input("Number of tracks (default 20): ") or "20")
+        
+        spotify = clients["Spotify"]
+        if not len(spotify.feature_store):
+            if input("No audio features are cached yet. Cache them for your Spotify library now? (y/n): ").lower() == 'y':
+                count = run_profiled("cache_library_features", spotify.cache_library_features)
+                print(f"Cached audio features for {count} tracks")
+            elif not search_query:
+                print("Nothing to choose from: cache your library's features or give a search query.")
+                return
+        
+        try:
+            criteria = {"limit": limit}
+            if target:
+                criteria["target"] = {k.strip(): float(v) for k, v in (pair.split('=') for pair in target.split(','))}
+            if ranges:
+                criteria["ranges"] = {k.strip(): [float(x) for x in v.split(':')]
+                                      for k, v in (pair.split('=') for pair in ranges.split(','))}
+            if search_query:
+                criteria["search_query"] = search_query
+            
+            result = PlaylistUtils.create_playlist_from_audio_criteria(clients, criteria, target_platform, playlist_name)
+        except ValueError as e:
+            print(f"Invalid audio profile: {e}")
+            result = None
+        if result:
+            print(f"Playlist created: {result['name']} with {result['tracks_added']} tracks")
 
 def batch_operations_menu(clients):
     """Menu for batch operations"""
@@ -482,17 +609,111 @@ def batch_operations_menu(clients):
         
         for platform in platforms:
             print(f"Backing up {platform} playlists...")
-            filename = clients[platform].backup_playlists()
+            filename = run_profiled("backup_playlists", clients[platform].backup_playlists)
             print(f"✓ {platform} backup completed: {filename}")
 
-def main():
-    print("Welcome to PlaySync - Advanced Playlist Management Tool")
-    clients = {
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PlaySync - Multi-Platform Playlist Tool")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write per-endpoint API call metrics to FILE when the run ends")
+    parser.add_argument("--metrics-format", choices=["json", "prom"], default="json",
+                        help="metrics file format: JSON or Prometheus text (default: json)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile each menu action with cProfile and tracemalloc")
+    parser.add_argument("--profile-dir", default="profiles",
+                        help="directory for profiling output (default: profiles)")
+    parser.add_argument("--progress-log", metavar="FILE",
+                        help="append progress events of long-running jobs to FILE as JSON lines")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="do not draw progress lines on the terminal")
+    subcommands = parser.add_subparsers(dest="command")
+    diff_parser = subcommands.add_parser("diff", help="compare two backup summaries offline")
+    diff_parser.add_argument("old", help="older backup_summary_*.json")
+    diff_parser.add_argument("new", help="newer backup_summary_*.json")
+    diff_parser.add_argument("--output", metavar="FILE", help="also write the full diff to FILE as JSON")
+    daemon_parser = subcommands.add_parser("daemon", help="run sync and backup rules on a schedule")
+    daemon_parser.add_argument("config", help="JSON file with the scheduled rules")
+    daemon_parser.add_argument("--wait", action="store_true",
+                               help="wait for each rule's first scheduled time instead of running all rules at startup")
+    return parser.parse_args(argv)
+
+def run_diff(args):
+    """Print what changed between two backups, without any API calls"""
+    report = diff_backups(args.old, args.new)
+    print(f"Comparing {report['old'].get('backup_date')} -> {report['new'].get('backup_date')}")
+    print(f"\nAdded playlists ({len(report['added_playlists'])}):")
+    for playlist in report['added_playlists']:
+        print(f"+ {playlist['name']} ({playlist['tracks']} tracks)")
+    print(f"\nRemoved playlists ({len(report['removed_playlists'])}):")
+    for playlist in report['removed_playlists']:
+        print(f"- {playlist['name']} ({playlist['tracks']} tracks)")
+    print(f"\nRenamed playlists ({len(report['renamed_playlists'])}):")
+    for playlist in report['renamed_playlists']:
+        print(f"~ {playlist['old_name']} -> {playlist['new_name']}")
+    print(f"\nChanged playlists ({len(report['changed_playlists'])}):")
+    for playlist in report['changed_playlists']:
+        print(f"* {playlist['name']}: +{len(playlist['added_tracks'])} -{len(playlist['removed_tracks'])}")
+        for track in playlist['added_tracks']:
+            print(f"    + {track['name']} by {track['artist']}")
+        for track in playlist['removed_tracks']:
+            print(f"    - {track['name']} by {track['artist']}")
+    print(f"\nUnchanged playlists: {report['unchanged_playlists']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Full diff saved as: {args.output}")
+
+def create_clients():
+    return {
         "Spotify": SpotifyClient(),
         "Apple Music": AppleMusicClient(),
         "YouTube Music": YouTubeMusicClient()
     }
 
+def run_daemon(args):
+    """Run scheduled rules with one set of clients until interrupted"""
+    scheduler = Scheduler.from_file(create_clients(), args.config)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    print(f"PlaySync daemon started with {len(scheduler.rules)} rules (Ctrl+C to stop)")
+    try:
+        scheduler.run(run_immediately=not args.wait)
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running rules to finish...")
+    for rule_id, stats in scheduler.stats().items():
+        print(f"{rule_id}: {stats['runs']} runs, {stats['skipped']} skipped, {stats['failures']} failed")
+
+def setup_metrics_dump(filename, format):
+    """Dump metrics at exit, and on demand with SIGUSR1 where supported"""
+    atexit.register(metrics.dump, filename, format)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: metrics.dump(filename, format))
+
+def setup_progress(args):
+    """Draw job progress on an interactive terminal and optionally log every event"""
+    if not args.no_progress and sys.stderr.isatty():
+        progress.subscribe(TerminalRenderer(sys.stderr))
+    if args.progress_log:
+        sink = progress.subscribe(JSONLinesSink(args.progress_log))
+        atexit.register(sink.close)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        setup_metrics_dump(args.metrics, args.metrics_format)
+    if args.profile:
+        profiler.enable(args.profile_dir)
+    setup_progress(args)
+    if args.command == "diff":
+        run_diff(args)
+        return
+    if args.command == "daemon":
+        run_daemon(args)
+        return
+
+    print("Welcome to PlaySync - Advanced Playlist Management Tool")
+    clients = create_clients()
+
     while True:
         print("\n=== Main Menu ===")
         print("1. Convert playlist to other platforms")
@@ -509,8 +730,9 @@ def main():
         if choice == "1":
             source_type = input("Source platform (Spotify, Apple Music, YouTube Music): ")
             source_id = input(f"Enter {source_type} playlist URL/ID: ")
+            target_name = input(f"Enter name for new playlist(s): ")
             target_clients = {k: v for k, v in clients.items() if k != source_type}
-            convert_playlist(clients[source_type], source_type, target_clients, source_id)
+            convert_playlist(clients[source_type], source_type, target_clients, source_id, target_name)
 
         elif choice == "2":
             sources = {}
@@ -518,7 +740,9 @@ def main():
                 if input(f"Include {platform} playlist? (y/n): ").lower() == 'y':
                     sources[platform] = input(f"Enter {platform} playlist URL/ID: ")
             if len(sources) > 1:
-                merge_playlists(clients, sources)
+                target_type = input("Enter target platform (Spotify, Apple Music, YouTube Music): ")
+                target_name = input("Enter name for merged playlist: ")
+                merge_playlists(clients, sources, target_type, target_name)
             else:
                 print("Need at least 2 playlists to merge.")
 
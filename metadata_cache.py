@@ -0,0 +1,220 @@
+import json
+import math
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from cache import cache_dir
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def _lock_exclusive(f):
+    """Block until this process holds an exclusive lock on an open file; closing the file releases it"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+class ArtistCache:
+    """Persistent artist metadata (genres, popularity) keyed by Spotify artist ID"""
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600):
+        self.path = path or os.path.join(cache_dir("metadata"), "artists.sqlite3")
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS artists ("
+                "id TEXT PRIMARY KEY, name TEXT, genres TEXT, popularity INTEGER, fetched_at REAL)"
+            )
+
+    def get_many(self, artist_ids):
+        """Get fresh cached entries for the given IDs as {id: {name, genres, popularity}}"""
+        found = {}
+        cutoff = time.time() - self.ttl
+        ids = list(artist_ids)
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, name, genres, popularity FROM artists WHERE fetched_at >= ? AND id IN ({placeholders})",
+                    [cutoff] + chunk
+                )
+                for artist_id, name, genres, popularity in rows:
+                    found[artist_id] = {"name": name, "genres": json.loads(genres), "popularity": popularity}
+            self.hits += len(found)
+            self.misses += len(set(ids)) - len(found)
+        return found
+
+    def put_many(self, artists):
+        """Store Spotify artist objects"""
+        now = time.time()
+        rows = [
+            (artist['id'], artist.get('name', ''), json.dumps(artist.get('genres', [])), artist.get('popularity', 0), now)
+            for artist in artists if artist
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO artists VALUES (?, ?, ?, ?, ?)", rows)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class AudioFeatureStore:
+    """Permanent, memory-mappable store of Spotify audio features keyed by track ID
+
+    IDs are kept as fixed-width records in one file and the features as a
+    row-major float32 matrix in another, so the matrix can be mapped straight
+    into memory (e.g. with mmap or numpy.memmap) for vectorized work.
+    """
+
+    FIELDS = (
+        "danceability", "energy", "key", "loudness", "mode", "speechiness", "acousticness",
+        "instrumentalness", "liveness", "valence", "tempo", "duration_ms", "time_signature"
+    )
+    INTEGER_FIELDS = ("key", "mode", "duration_ms", "time_signature")
+    ID_WIDTH = 22
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.row_size = len(self.FIELDS) * 4
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._ids = []
+        self._mmap = None
+        self._view = None
+        self._opened = False
+
+    def _open(self):
+        if not self._opened:
+            self.directory = self.directory or cache_dir("metadata")
+            self.ids_path = os.path.join(self.directory, "audio_features.ids")
+            self.matrix_path = os.path.join(self.directory, "audio_features.f32")
+            self.lock_path = os.path.join(self.directory, "audio_features.lock")
+            for path in (self.ids_path, self.matrix_path, self.lock_path):
+                open(path, 'ab').close()
+            self._opened = True
+        self._refresh()
+
+    def _committed_rows(self):
+        """Rows present in both files; a crash mid-append can leave either file longer"""
+        return min(os.path.getsize(self.ids_path) // self.ID_WIDTH, os.path.getsize(self.matrix_path) // self.row_size)
+
+    def _refresh(self):
+        """Pick up rows appended since the last look, including by other stores or processes"""
+        count = self._committed_rows()
+        if count <= len(self._ids):
+            return
+        with open(self.ids_path, 'rb') as f:
+            f.seek(len(self._ids) * self.ID_WIDTH)
+            raw_ids = f.read((count - len(self._ids)) * self.ID_WIDTH)
+        for offset in range(0, len(raw_ids), self.ID_WIDTH):
+            track_id = raw_ids[offset:offset + self.ID_WIDTH].decode("ascii")
+            self._rows.setdefault(track_id, len(self._ids))
+            self._ids.append(track_id)
+
+    def __len__(self):
+        with self._lock:
+            self._open()
+            return len(self._ids)
+
+    def __contains__(self, track_id):
+        with self._lock:
+            self._open()
+            return track_id in self._rows
+
+    def _matrix(self):
+        """Flat float32 view over the mapped feature matrix"""
+        if self._view is None or len(self._view) < len(self._ids) * len(self.FIELDS):
+            # Earlier views may still be held by callers; they stay valid until dropped
+            self._mmap = self._view = None
+            if self._ids:
+                with open(self.matrix_path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), len(self._ids) * self.row_size, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap).cast('f')
+        return self._view
+
+    def _to_dict(self, track_id, values):
+        if math.isnan(values[0]):
+            return None
+        features = {"id": track_id}
+        for field, value in zip(self.FIELDS, values):
+            features[field] = int(value) if field in self.INTEGER_FIELDS else round(value, 6)
+        return features
+
+    def get_many(self, track_ids):
+        """Get stored features as {track_id: features}; tracks Spotify has no features for map to None"""
+        found = {}
+        with self._lock:
+            self._open()
+            matrix = self._matrix()
+            width = len(self.FIELDS)
+            for track_id in track_ids:
+                row = self._rows.get(track_id)
+                if row is not None:
+                    found[track_id] = self._to_dict(track_id, matrix[row * width:(row + 1) * width].tolist())
+        return found
+
+    def put_many(self, features_by_id):
+        """Append features for new track IDs; None records that a track has no features
+
+        Appends happen under an exclusive lock on the store's lock file. The
+        row number is the matrix's committed row count at that moment, so
+        several stores or processes sharing the directory never interleave.
+        Rows are written before IDs, and an ID is the commit record for its
+        row: anything past the shorter file is a torn append and is cut off.
+        """
+        with self._lock:
+            self._open()
+            with open(self.lock_path, 'r+b') as lock_file:
+                _lock_exclusive(lock_file)
+                # Another store or process may have appended since the last refresh
+                self._refresh()
+                ids = []
+                rows = array('f')
+                for track_id, features in features_by_id.items():
+                    if track_id in self._rows or not track_id or len(track_id) != self.ID_WIDTH:
+                        continue
+                    ids.append(track_id)
+                    if features is None:
+                        rows.extend([math.nan] * len(self.FIELDS))
+                    else:
+                        rows.extend(float(features.get(field) or 0) for field in self.FIELDS)
+                if not ids:
+                    return
+                count = self._committed_rows()
+                with open(self.matrix_path, 'r+b') as f:
+                    f.truncate(count * self.row_size)
+                    f.seek(0, os.SEEK_END)
+                    rows.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.ids_path, 'r+b') as f:
+                    f.truncate(count * self.ID_WIDTH)
+                    f.seek(0, os.SEEK_END)
+                    f.write("".join(ids).encode("ascii"))
+                self._refresh()
+
+    def matrix(self):
+        """Get (track IDs, flat float32 feature view) over every stored row"""
+        with self._lock:
+            self._open()
+            return list(self._ids), self._matrix()
+
+
+audio_feature_store = AudioFeatureStore()
@@ -0,0 +1,218 @@
+import copy
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class EndpointStats:
+    """Counters for a single platform/endpoint pair"""
+
+    def __init__(self, buckets):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def to_dict(self, buckets):
+        histogram = {}
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], self.bucket_counts):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "latency_sum_s": round(self.latency_sum, 6),
+            "latency_avg_s": round(self.latency_sum / self.calls, 6) if self.calls else 0,
+            "latency_max_s": round(self.latency_max, 6),
+            "latency_histogram": histogram
+        }
+
+
+def _counting_retry_class(base, registry, platform):
+    class CountingRetry(base):
+        _playsync_counted = True
+
+        def increment(self, *args, **kwargs):
+            # Raises once retries are exhausted, so only attempts that will be retried are counted
+            retry = super().increment(*args, **kwargs)
+            current = getattr(registry._local, "current", None)
+            registry.record_retry(current[0] if current else platform, current[1] if current else "unknown")
+            return retry
+
+    return CountingRetry
+
+
+class MetricsRegistry:
+    """Records call count, bytes, latency, retries and errors per platform and endpoint"""
+
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.LATENCY_BUCKETS)
+        self.started_at = time.time()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get(self, platform, endpoint):
+        key = (platform, endpoint)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = EndpointStats(self.buckets)
+        return stats
+
+    def call(self, platform, endpoint, func, *args, **kwargs):
+        """Run an outbound call and record its latency, size and outcome"""
+        previous = getattr(self._local, "current", None)
+        previous_bytes = getattr(self._local, "pending_bytes", 0)
+        self._local.current = (platform, endpoint)
+        self._local.pending_bytes = 0
+        start = time.perf_counter()
+        failed = False
+        try:
+            result = func(*args, **kwargs)
+            content = getattr(result, "content", None)
+            if isinstance(content, bytes):
+                self._local.pending_bytes += len(content)
+            failed = getattr(result, "status_code", 200) >= 400
+            return result
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.observe(platform, endpoint, time.perf_counter() - start,
+                         size=self._local.pending_bytes, error=failed)
+            self._local.current = previous
+            self._local.pending_bytes = previous_bytes
+
+    def observe(self, platform, endpoint, latency, size=0, error=False):
+        """Record one completed call"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if latency <= bound:
+                index = i
+                break
+        with self._lock:
+            stats = self._get(platform, endpoint)
+            stats.calls += 1
+            stats.bytes += size
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            stats.bucket_counts[index] += 1
+            if error:
+                stats.errors += 1
+
+    def record_retry(self, platform, endpoint):
+        """Count a retried attempt of a call"""
+        with self._lock:
+            self._get(platform, endpoint).retries += 1
+
+    def record_bytes(self, size):
+        """Attribute response bytes to the call running on this thread"""
+        if getattr(self._local, "current", None) is not None:
+            self._local.pending_bytes += size
+
+    def attach_session(self, session):
+        """Count response bytes for calls made through a requests session"""
+        def _count_bytes(response, *args, **kwargs):
+            self.record_bytes(len(response.content or b""))
+            return response
+
+        hooks = getattr(session, "hooks", None)
+        if hooks is not None:
+            hooks.setdefault("response", []).append(_count_bytes)
+
+    def count_retries(self, session, platform):
+        """Count retries made by the urllib3 Retry of each transport adapter mounted on a requests session
+
+        Clients that retry inside their HTTP library (spotipy, ytmusicapi)
+        never see the retried attempts, so the Retry object reports them.
+        """
+        for adapter in getattr(session, "adapters", {}).values():
+            retry = getattr(adapter, "max_retries", None)
+            if retry is None or getattr(retry, "_playsync_counted", False):
+                continue
+            counting = copy.copy(retry)
+            counting.__class__ = _counting_retry_class(type(retry), self, platform)
+            adapter.max_retries = counting
+
+    def total_calls(self):
+        """Total number of outbound calls recorded so far"""
+        with self._lock:
+            return sum(stats.calls for stats in self._stats.values())
+
+    def snapshot(self):
+        """Get a plain dict of all recorded metrics"""
+        with self._lock:
+            platforms = {}
+            for (platform, endpoint), stats in sorted(self._stats.items()):
+                platforms.setdefault(platform, {})[endpoint] = stats.to_dict(self.buckets)
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "uptime_s": round(time.time() - self.started_at, 3),
+            "platforms": platforms
+        }
+
+    def to_prometheus(self):
+        """Render metrics in the Prometheus text exposition format"""
+        lines = []
+        series = (
+            ("playsync_api_calls_total", "counter", "Outbound API calls", "calls"),
+            ("playsync_api_errors_total", "counter", "Outbound API calls that raised", "errors"),
+            ("playsync_api_retries_total", "counter", "Retried outbound API calls", "retries"),
+            ("playsync_api_response_bytes_total", "counter", "Response body bytes received", "bytes"),
+        )
+        with self._lock:
+            items = sorted(self._stats.items())
+            for name, kind, help_text, attr in series:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (platform, endpoint), stats in items:
+                    lines.append(f'{name}{{platform="{platform}",endpoint="{endpoint}"}} {getattr(stats, attr)}')
+
+            name = "playsync_api_latency_seconds"
+            lines.append(f"# HELP {name} Outbound API call latency")
+            lines.append(f"# TYPE {name} histogram")
+            for (platform, endpoint), stats in items:
+                labels = f'platform="{platform}",endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ["+Inf"], stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {stats.latency_sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {stats.calls}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filename=None, format='json'):
+        """Write metrics to a JSON or Prometheus text file"""
+        if format not in ('json', 'prom'):
+            raise ValueError(f"Unsupported metrics format: {format}")
+        if not filename:
+            extension = "json" if format == 'json' else "prom"
+            filename = f"playsync_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, 'w') as f:
+            if format == 'json':
+                json.dump(self.snapshot(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+        return filename
+
+    def reset(self):
+        """Drop all recorded metrics"""
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,220 @@
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Innermost frames of threads that are blocked waiting for work, not doing any
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+}
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stacks of all busy threads into collapsed-stack counts
+
+    Threads parked on a lock, queue or selector (idle pool workers,
+    background refreshers, a caller waiting on futures) are skipped.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="playsync-profiler", daemon=True)
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(label.replace(";", ":"))
+                    frame = frame.f_back
+                if thread_id != threading.main_thread().ident:
+                    stack.append(f"thread {names.get(thread_id, thread_id)}")
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _Session:
+    """State for one profiled top-level action"""
+
+    def __init__(self, name, sizes):
+        self.name = name
+        self.sizes = dict(sizes)
+        self.profile = cProfile.Profile()
+        self.sampler = None
+        self.started = time.perf_counter()
+        self.started_tracemalloc = False
+
+
+class Profiler:
+    """Wraps top-level actions in cProfile, a stack sampler and tracemalloc"""
+
+    def __init__(self):
+        self.output_dir = None
+        self.top_n = 25
+        self.interval = 0.005
+        self._active = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.output_dir is not None
+
+    def enable(self, output_dir="profiles", top_n=25, interval=0.005):
+        """Turn on profiling, writing results to output_dir"""
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.interval = interval
+
+    def disable(self):
+        self.output_dir = None
+
+    def tag(self, **sizes):
+        """Attach input sizes to the action being profiled"""
+        session = self._active
+        if session is not None:
+            session.sizes.update(sizes)
+
+    @contextmanager
+    def action(self, name, **sizes):
+        """Profile the wrapped block as one action; nested actions only add tags"""
+        with self._lock:
+            start_session = self.enabled and name is not None and self._active is None
+            if start_session:
+                session = self._active = _Session(name, sizes)
+        if not start_session:
+            self.tag(**sizes)
+            yield
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            session.started_tracemalloc = True
+        else:
+            tracemalloc.clear_traces()
+        session.sampler = _StackSampler(self.interval)
+        session.sampler.start()
+        session.profile.enable()
+        try:
+            yield
+        finally:
+            session.profile.disable()
+            session.sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if session.started_tracemalloc:
+                tracemalloc.stop()
+            elapsed = time.perf_counter() - session.started
+            with self._lock:
+                self._active = None
+            try:
+                self._write(session, snapshot, peak, elapsed)
+            except OSError as e:
+                print(f"Error writing profile for {session.name}: {e}")
+
+    def _write(self, session, snapshot, peak, elapsed):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", session.name)
+        base = os.path.join(self.output_dir, f"{slug}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+        size_tag = ",".join(f"{k}={v}" for k, v in sorted(session.sizes.items()))
+        root = f"{session.name}[{size_tag}]" if size_tag else session.name
+
+        session.profile.dump_stats(f"{base}.prof")
+
+        with open(f"{base}.folded", 'w', encoding='utf-8') as f:
+            for stack, count in sorted(session.sampler.counts.items()):
+                f.write(f"{root};{stack} {count}\n")
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        top_stats = snapshot.filter_traces(filters).statistics('lineno')[:self.top_n]
+        with open(f"{base}.alloc.txt", 'w', encoding='utf-8') as f:
+            f.write(f"# {root} peak={peak} bytes\n")
+            for stat in top_stats:
+                frame = stat.traceback[0]
+                f.write(f"{stat.size}\t{stat.count}\t{frame.filename}:{frame.lineno}\n")
+
+        stream = io.StringIO()
+        stats = pstats.Stats(session.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(stream.getvalue())
+
+        summary = {
+            "action": session.name,
+            "sizes": session.sizes,
+            "elapsed_s": round(elapsed, 6),
+            "peak_memory_bytes": peak,
+            "samples": sum(session.sampler.counts.values()),
+            "files": {
+                "cprofile": f"{base}.prof",
+                "collapsed_stacks": f"{base}.folded",
+                "allocations": f"{base}.alloc.txt",
+                "cprofile_text": f"{base}.txt"
+            }
+        }
+        with open(f"{base}.json", 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def _input_sizes(func, args, kwargs):
+    """Get the length of every sized, non-string argument"""
+    names = func.__code__.co_varnames[:func.__code__.co_argcount]
+    if inspect.ismethod(func):
+        names = names[1:]
+    sizes = {}
+    for name, value in list(zip(names, args)) + list(kwargs.items()):
+        if hasattr(value, '__len__') and not isinstance(value, (str, bytes)):
+            sizes[name] = len(value)
+    return sizes
+
+
+def profiled(name=None):
+    """Decorator that profiles a function as an action tagged with its input sizes"""
+    def decorator(func):
+        action_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.action(action_name, **_input_sizes(func, args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+profiler = Profiler()
+
+if os.getenv("PLAYSYNC_PROFILE_DIR"):
+    profiler.enable(os.getenv("PLAYSYNC_PROFILE_DIR"))
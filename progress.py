@@ -0,0 +1,192 @@
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from metrics import metrics
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ProgressJob:
+    """One long-running operation reporting items done, tracks moved and its current phase
+
+    API call throughput is measured from the metrics registry, so it counts
+    every outbound call made while the job runs.
+    """
+
+    def __init__(self, bus, name, total=None, phase=None):
+        self.bus = bus
+        self.name = name
+        self.total = total
+        self.phase = phase
+        self.done = 0
+        self.tracks = 0
+        self.status = "running"
+        self.started_at = time.monotonic()
+        self._calls_at_start = metrics.total_calls()
+        self._lock = threading.Lock()
+
+    def _emit(self, event):
+        if self.bus.active:
+            self.bus.publish(self.snapshot(event))
+
+    def set_phase(self, phase):
+        with self._lock:
+            self.phase = phase
+        self._emit("phase")
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+        self._emit("progress")
+
+    def advance(self, items=1, tracks=0):
+        with self._lock:
+            self.done += items
+            self.tracks += tracks
+        self._emit("progress")
+
+    def finish(self, status="done"):
+        with self._lock:
+            if self.status != "running":
+                return
+            self.status = status
+        self._emit("finish")
+
+    def snapshot(self, event="progress"):
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            calls = metrics.total_calls() - self._calls_at_start
+            eta = None
+            if self.total and self.done and self.status == "running":
+                eta = elapsed / self.done * max(self.total - self.done, 0)
+            return {
+                "time": datetime.now().isoformat(),
+                "event": event,
+                "job": self.name,
+                "phase": self.phase,
+                "status": self.status,
+                "done": self.done,
+                "total": self.total,
+                "tracks": self.tracks,
+                "api_calls": calls,
+                "elapsed_s": round(elapsed, 3),
+                "tracks_per_s": round(self.tracks / elapsed, 2) if elapsed > 0 else 0.0,
+                "calls_per_s": round(calls / elapsed, 2) if elapsed > 0 else 0.0,
+                "eta_s": round(eta, 1) if eta is not None else None
+            }
+
+    def __enter__(self):
+        self._emit("start")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish("failed" if exc_type else "done")
+
+
+class TerminalRenderer:
+    """Draws one status line per job, rewritten in place on a terminal"""
+
+    def __init__(self, stream=None, interval=0.2):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.interactive = self.stream.isatty()
+        self._last_draw = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = self.format(event)
+        with self._lock:
+            now = time.monotonic()
+            final = event["event"] in ("start", "phase", "finish")
+            if not final and now - self._last_draw.get(event["job"], 0) < self.interval:
+                return
+            self._last_draw[event["job"]] = now
+            if self.interactive:
+                self.stream.write("\r\033[K" + line + ("\n" if event["event"] == "finish" else ""))
+            elif final:
+                self.stream.write(line + "\n")
+            self.stream.flush()
+
+    @staticmethod
+    def format(event):
+        parts = [f"[{event['job']}]"]
+        if event["phase"]:
+            parts.append(event["phase"])
+        if event["total"]:
+            parts.append(f"{event['done']}/{event['total']} ({event['done'] / event['total']:.0%})")
+        else:
+            parts.append(f"{event['done']} done")
+        parts.append(f"{event['tracks_per_s']} tracks/s")
+        parts.append(f"{event['calls_per_s']} calls/s")
+        if event["event"] == "finish":
+            parts.append(f"{event['status']} in {_format_duration(event['elapsed_s'])}")
+        elif event["eta_s"] is not None:
+            parts.append(f"ETA {_format_duration(event['eta_s'])}")
+        return " ".join(parts)
+
+
+class JSONLinesSink:
+    """Appends every progress event to a file as one JSON object per line"""
+
+    def __init__(self, filename):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.filename = filename
+        self._f = open(filename, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            if not self._f.closed:
+                self._f.write(json.dumps(event) + "\n")
+                self._f.flush()
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+class ProgressBus:
+    """Fans progress events out to subscribed sinks; with no sinks, jobs cost next to nothing"""
+
+    def __init__(self):
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, sink):
+        with self._lock:
+            self._sinks.append(sink)
+        return sink
+
+    def unsubscribe(self, sink):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    @property
+    def active(self):
+        return bool(self._sinks)
+
+    def job(self, name, total=None, phase=None):
+        """Start a job; use it as a context manager so it finishes (or fails) on exit"""
+        return ProgressJob(self, name, total, phase)
+
+    def publish(self, event):
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                print(f"Error in progress sink: {e}")
+
+
+progress = ProgressBus()
@@ -0,0 +1,154 @@
+import heapq
+import json
+import math
+import os
+import threading
+from backups import BackupReader
+from cache import cache_dir
+from sketches import track_key
+
+
+class CooccurrenceRecommender:
+    """Local recommender over a sparse playlist/track incidence matrix
+
+    Tracks that appear in the same playlists as the seed tracks (or as the
+    seed artists) score highest. Playlists are weighted down by their size
+    so huge catch-all playlists do not dominate, and only the most similar
+    playlists are scored so queries stay fast on large libraries. Everything
+    is answered from the local matrix, which is updated one playlist at a time.
+    """
+
+    ARTIST_WEIGHT = 0.25
+    NEIGHBORS = 200
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._tracks = []
+        self._track_index = {}
+        self._playlists = {}
+        self._track_postings = {}
+        self._artist_postings = {}
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self.path = self.path or os.path.join(cache_dir("recommender"), "cooccurrence.json")
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading recommender data: {e}")
+            return
+        self._tracks = data["tracks"]
+        self._track_index = {track_key(track): i for i, track in enumerate(self._tracks)}
+        for playlist_key, indices in data["playlists"].items():
+            self._index_playlist(playlist_key, indices)
+
+    def _index_playlist(self, playlist_key, indices):
+        self._playlists[playlist_key] = indices
+        for index in indices:
+            self._track_postings.setdefault(index, set()).add(playlist_key)
+            artist = self._tracks[index]['artist'].lower()
+            self._artist_postings.setdefault(artist, set()).add(playlist_key)
+
+    def _unindex_playlist(self, playlist_key):
+        for index in self._playlists.pop(playlist_key, []):
+            self._track_postings.get(index, set()).discard(playlist_key)
+            artist = self._tracks[index]['artist'].lower()
+            postings = self._artist_postings.get(artist)
+            if postings is not None:
+                postings.discard(playlist_key)
+
+    def _intern(self, track):
+        key = track_key(track)
+        index = self._track_index.get(key)
+        if index is None:
+            index = self._track_index[key] = len(self._tracks)
+            self._tracks.append({
+                "name": track.get('name', ''),
+                "artist": track.get('artist', ''),
+                "album": track.get('album', '')
+            })
+        return index
+
+    def update_playlist(self, platform, playlist_id, tracks):
+        """Replace one playlist's column of the matrix"""
+        with self._lock:
+            self._ensure_loaded()
+            playlist_key = f"{platform}:{playlist_id}"
+            self._unindex_playlist(playlist_key)
+            indices = list(dict.fromkeys(self._intern(track) for track in tracks))
+            if indices:
+                self._index_playlist(playlist_key, indices)
+
+    def remove_playlist(self, platform, playlist_id):
+        with self._lock:
+            self._ensure_loaded()
+            self._unindex_playlist(f"{platform}:{playlist_id}")
+
+    def playlist_tracks(self, platform, playlist_id):
+        """Get the stored tracks of a playlist, or None if it is not in the matrix"""
+        with self._lock:
+            self._ensure_loaded()
+            indices = self._playlists.get(f"{platform}:{playlist_id}")
+            return None if indices is None else [dict(self._tracks[i]) for i in indices]
+
+    def load_backup(self, summary_file, platform):
+        """Add every playlist of a backup summary file"""
+        with BackupReader(summary_file) as reader:
+            for playlist in reader:
+                self.update_playlist(platform, playlist['id'], playlist.get('tracks', []))
+            return len(reader)
+
+    def recommend(self, seed_tracks, limit=20):
+        """Score tracks co-occurring with the seeds and return the top ones"""
+        with self._lock:
+            self._ensure_loaded()
+            seeds = {self._track_index[key] for key in map(track_key, seed_tracks) if key in self._track_index}
+            seed_artists = {track.get('artist', '').lower() for track in seed_tracks if track.get('artist')}
+
+            overlap = {}
+            for index in seeds:
+                for playlist_key in self._track_postings.get(index, ()):
+                    overlap[playlist_key] = overlap.get(playlist_key, 0.0) + 1.0
+            for artist in seed_artists:
+                for playlist_key in self._artist_postings.get(artist, ()):
+                    overlap[playlist_key] = overlap.get(playlist_key, 0.0) + self.ARTIST_WEIGHT
+
+            weights = (
+                (weight / math.log2(2 + len(self._playlists[playlist_key])), playlist_key)
+                for playlist_key, weight in overlap.items()
+            )
+            scores = {}
+            for weight, playlist_key in heapq.nlargest(self.NEIGHBORS, weights):
+                for index in self._playlists[playlist_key]:
+                    scores[index] = scores.get(index, 0.0) + weight
+            for index in seeds:
+                scores.pop(index, None)
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [dict(self._tracks[index], score=round(score, 4)) for index, score in best]
+
+    def save(self):
+        """Write the matrix to disk"""
+        with self._lock:
+            if not self._loaded:
+                return
+            data = {"tracks": self._tracks, "playlists": self._playlists}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def stats(self):
+        with self._lock:
+            self._ensure_loaded()
+            return {"tracks": len(self._tracks), "playlists": len(self._playlists)}
+
+
+recommender = CooccurrenceRecommender()
@@ -0,0 +1,261 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from ratelimit import RateLimiter
+from utils import PlaylistUtils
+
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        spec, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(value) for value in spec.split("-", 1))
+        else:
+            start = int(spec)
+            end = high if step > 1 else start
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"Invalid cron field: {field!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """A 5-field cron expression (minute hour day-of-month month day-of-week)
+
+    Fields accept *, numbers, ranges, lists and /steps. As in cron, when
+    both day fields are restricted a day matching either of them runs.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _cron_field(field, low, high) for field, (low, high) in zip(fields, _CRON_RANGES)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """The first matching minute strictly after moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class ScheduledRule:
+    """A sync or backup job from the daemon config, with its schedule and run history"""
+
+    def __init__(self, config, index):
+        self.config = config
+        self.id = config.get("id") or f"{config.get('type', 'rule')}-{index + 1}"
+        self.type = config.get("type")
+        if self.type not in ("sync", "backup"):
+            raise ValueError(f"Rule {self.id}: type must be 'sync' or 'backup'")
+        self.priority = int(config.get("priority", 10))
+        self.cron = CronSchedule(config["cron"]) if config.get("cron") else None
+        self.interval = float(config["every"]) if config.get("every") else None
+        if not (self.cron or self.interval):
+            raise ValueError(f"Rule {self.id}: needs 'every' (seconds) or 'cron'")
+        if self.type == "sync":
+            self.platforms = sorted({config["source_platform"], *config["target_platforms"]})
+        else:
+            self.platforms = [config["platform"]]
+        self.running = False
+        self.source_version = None
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_status = None
+        self.last_duration = None
+
+    def next_run(self, now):
+        """Wall-clock timestamp of the next run after now"""
+        if self.cron:
+            return self.cron.next_after(datetime.fromtimestamp(now)).timestamp()
+        return now + self.interval
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_status": self.last_status,
+            "last_duration_s": round(self.last_duration, 3) if self.last_duration is not None else None
+        }
+
+
+class Scheduler:
+    """Long-running scheduler for sync and backup rules
+
+    Due rules come off a heap ordered by run time, then priority (lower
+    runs first), and execute on a worker pool. Each platform has a
+    concurrency limit and a budget of rule runs per minute, shared by all
+    rules touching it. A rule still running when it comes due again is
+    skipped, as is a sync whose source playlist has not changed since its
+    last successful run. Clients and caches are reused across runs.
+    """
+
+    def __init__(self, clients, config):
+        self.clients = clients
+        self.rules = [ScheduledRule(rule, i) for i, rule in enumerate(config.get("rules", []))]
+        self.workers = int(config.get("workers", 4))
+        self.semaphores = {}
+        self.budgets = {}
+        for platform in clients:
+            limits = config.get("platforms", {}).get(platform, {})
+            self.semaphores[platform] = threading.BoundedSemaphore(int(limits.get("concurrency", 1)))
+            self.budgets[platform] = RateLimiter(float(limits.get("runs_per_minute", 6)) / 60,
+                                                 capacity=limits.get("burst", 1))
+        for rule in self.rules:
+            unknown = [platform for platform in rule.platforms if platform not in clients]
+            if unknown:
+                raise ValueError(f"Rule {rule.id}: unknown platforms {unknown}")
+        self._queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_file(cls, clients, filename):
+        with open(filename, 'r') as f:
+            return cls(clients, json.load(f))
+
+    def _push(self, rule, run_at):
+        heapq.heappush(self._queue, (run_at, rule.priority, next(self._sequence), rule))
+
+    def _log(self, rule, message):
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {rule.id}: {message}")
+
+    def run(self, run_immediately=True):
+        """Run due rules until stop() is called"""
+        now = time.time()
+        with self._lock:
+            self._queue = []
+            for rule in self.rules:
+                self._push(rule, now if run_immediately else rule.next_run(now))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while self._queue and not self._stop_event.is_set():
+                with self._lock:
+                    run_at, _, _, rule = self._queue[0]
+                    delay = run_at - time.time()
+                    if delay <= 0:
+                        heapq.heappop(self._queue)
+                        self._push(rule, rule.next_run(max(run_at, time.time())))
+                if delay > 0:
+                    self._stop_event.wait(delay)
+                    continue
+                with self._lock:
+                    if rule.running:
+                        rule.skipped += 1
+                        self._log(rule, "still running, skipped")
+                        continue
+                    rule.running = True
+                executor.submit(self._execute, rule)
+        self._stop_event.clear()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _execute(self, rule):
+        started = time.monotonic()
+        acquired = []
+        try:
+            # Fixed order so two rules sharing platforms cannot deadlock
+            for platform in rule.platforms:
+                self.semaphores[platform].acquire()
+                acquired.append(platform)
+            for platform in rule.platforms:
+                self.budgets[platform].acquire()
+            status = self._run_sync(rule) if rule.type == "sync" else self._run_backup(rule)
+        except Exception as e:
+            status = "failed"
+            self._log(rule, f"failed: {e}")
+        finally:
+            for platform in reversed(acquired):
+                self.semaphores[platform].release()
+        with self._lock:
+            rule.running = False
+            rule.last_status = status
+            rule.last_duration = time.monotonic() - started
+            if status == "failed":
+                rule.failures += 1
+            elif status == "unchanged":
+                rule.skipped += 1
+            else:
+                rule.runs += 1
+
+    def _run_sync(self, rule):
+        config = rule.config
+        source = self.clients[config["source_platform"]]
+        version = None
+        if config.get("skip_unchanged", True):
+            try:
+                version = source.get_playlist_version(config["playlist_id"])
+            except Exception as e:
+                self._log(rule, f"could not check source version: {e}")
+            if version is not None and version == rule.source_version:
+                self._log(rule, "source playlist unchanged, skipped")
+                return "unchanged"
+        results = PlaylistUtils.sync_playlists_across_platforms(self.clients, [config])
+        failed = [result for result in results if result['status'] != 'success']
+        for result in results:
+            if result['status'] == 'success':
+                self._log(rule, f"{result['source_platform']} -> {result['target_platform']}: "
+                                f"{result['tracks_added']} tracks")
+            else:
+                self._log(rule, f"failed: {result['error']}")
+        if failed:
+            return "failed"
+        rule.source_version = version
+        return "success"
+
+    def _run_backup(self, rule):
+        config = rule.config
+        client = self.clients[config["platform"]]
+        if config.get("backup_dir"):
+            filename = client.backup_playlists(config["backup_dir"])
+        else:
+            filename = client.backup_playlists()
+        self._log(rule, f"backup written to {filename}")
+        return "success"
+
+    def stats(self):
+        with self._lock:
+            upcoming = {rule.id: run_at for run_at, _, _, rule in self._queue}
+            return {
+                rule.id: dict(rule.stats(), running=rule.running,
+                              next_run=datetime.fromtimestamp(upcoming[rule.id]).isoformat()
+                              if rule.id in upcoming else None)
+                for rule in self.rules
+            }
@@ -0,0 +1,100 @@
+import os
+import threading
+from cache import DiskCache, TTLCache
+
+
+def normalize_query(query):
+    """Lowercase a search query and collapse its whitespace"""
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """Two-tier cache of search_tracks results: an in-memory LRU in front of a disk store
+
+    Entries are keyed by platform, normalized query and limit, and expire
+    after ttl seconds in both tiers. A disk hit is promoted to memory. The
+    disk store is pruned to max_disk_entries when it is opened and again
+    every prune_every writes.
+    """
+
+    def __init__(self, ttl=None, maxsize=None, max_disk_entries=None, name="search", prune_every=100):
+        self.ttl = ttl if ttl is not None else float(os.getenv("PLAYSYNC_SEARCH_TTL", "86400"))
+        maxsize = maxsize if maxsize is not None else int(os.getenv("PLAYSYNC_SEARCH_CACHE_SIZE", "512"))
+        self.max_disk_entries = (max_disk_entries if max_disk_entries is not None
+                                 else int(os.getenv("PLAYSYNC_SEARCH_DISK_ENTRIES", "10000")))
+        self.name = name
+        self.prune_every = prune_every
+        self.memory = TTLCache(ttl=self.ttl, maxsize=maxsize)
+        self._store = None
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        with self._lock:
+            if self._store is None:
+                self._store = DiskCache(self.name, ttl=self.ttl)
+                self._store.prune(self.max_disk_entries)
+            return self._store
+
+    @staticmethod
+    def key(platform, query, limit):
+        return (platform, normalize_query(query), int(limit))
+
+    def get(self, platform, query, limit):
+        """Cached results for a search, or None. Callers get their own copies of the track dicts."""
+        if self.ttl <= 0:
+            return None
+        key = self.key(platform, query, limit)
+        tracks = self.memory.get(key)
+        tier = "memory"
+        if tracks is None:
+            tracks = self.store.get(list(key))
+            tier = "disk"
+            if tracks is not None:
+                self.memory.set(key, tracks)
+        with self._lock:
+            if tracks is None:
+                self.misses += 1
+                return None
+            if tier == "memory":
+                self.memory_hits += 1
+            else:
+                self.disk_hits += 1
+        return [dict(track) for track in tracks]
+
+    def set(self, platform, query, limit, tracks):
+        """Store a non-empty result; empty ones may stand for a failed request and are not cached"""
+        if self.ttl <= 0 or not tracks:
+            return
+        key = self.key(platform, query, limit)
+        tracks = [dict(track) for track in tracks]
+        self.memory.set(key, tracks)
+        self.store.set(list(key), tracks)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.store.prune(self.max_disk_entries)
+
+    def clear(self):
+        self.memory.clear()
+        self.store.prune(0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": self.memory.stats()["entries"],
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,112 @@
+import hashlib
+import random
+from sketches import track_key
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _hash(item):
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big") % _MERSENNE_PRIME
+
+
+def _bands_for(threshold, num_perm):
+    """Pick (bands, rows) with bands * rows <= num_perm whose LSH threshold is closest to the target"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        estimate = (1 / bands) ** (1 / rows)
+        if best is None or abs(estimate - threshold) < best[0]:
+            best = (abs(estimate - threshold), bands, rows)
+    return best[1], best[2]
+
+
+class MinHash:
+    """MinHash signature of a set, using universal hashing modulo a Mersenne prime"""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)
+        ]
+
+    def signature(self, items):
+        hashes = [_hash(item) for item in items]
+        if not hashes:
+            return None
+        prime = _MERSENNE_PRIME
+        return tuple(min((a * h + b) % prime for h in hashes) for a, b in self.permutations)
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class PlaylistSimilarity:
+    """Find overlapping playlists with MinHash signatures and LSH banding
+
+    Playlists whose signatures agree on any band become candidate pairs,
+    which are then verified with an exact Jaccard over their track sets, so
+    the result has no false positives and only the candidates are compared.
+    """
+
+    def __init__(self, threshold=0.5, num_perm=128, seed=1):
+        self.threshold = threshold
+        self.minhash = MinHash(num_perm, seed)
+        # Band below the target so pairs near the threshold still collide; verification drops the extras
+        self.bands, self.rows = _bands_for(threshold * 0.8, num_perm)
+        self.playlists = {}
+        self._buckets = {}
+
+    def add(self, key, tracks, **info):
+        """Add a playlist under a unique key; extra info is kept for reporting"""
+        track_keys = frozenset(track_key(track) for track in tracks)
+        signature = self.minhash.signature(track_keys)
+        self.playlists[key] = dict(info, tracks=track_keys, signature=signature)
+        if signature is None:
+            return
+        for band in range(self.bands):
+            start = band * self.rows
+            bucket = (band, signature[start:start + self.rows])
+            self._buckets.setdefault(bucket, []).append(key)
+
+    def candidates(self):
+        pairs = set()
+        for keys in self._buckets.values():
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    pairs.add((keys[i], keys[j]) if keys[i] < keys[j] else (keys[j], keys[i]))
+        return pairs
+
+    def pairs(self):
+        """Get verified similar pairs, most similar first"""
+        found = []
+        for a, b in self.candidates():
+            first, second = self.playlists[a], self.playlists[b]
+            similarity = jaccard(first['tracks'], second['tracks'])
+            if similarity >= self.threshold:
+                estimate = sum(x == y for x, y in zip(first['signature'], second['signature'])) / len(first['signature'])
+                found.append({"a": a, "b": b, "jaccard": round(similarity, 4), "estimate": round(estimate, 4)})
+        found.sort(key=lambda pair: pair['jaccard'], reverse=True)
+        return found
+
+    def clusters(self, pairs=None):
+        """Group playlists connected by similar pairs (union-find), largest first"""
+        parent = {}
+
+        def find(key):
+            parent.setdefault(key, key)
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for pair in (pairs if pairs is not None else self.pairs()):
+            root_a, root_b = find(pair['a']), find(pair['b'])
+            if root_a != root_b:
+                parent[root_b] = root_a
+        groups = {}
+        for key in parent:
+            groups.setdefault(find(key), []).append(key)
+        return sorted((sorted(group) for group in groups.values()), key=len, reverse=True)
@@ -0,0 +1,183 @@
+import base64
+import hashlib
+import math
+
+
+def _hash64(item):
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y = 1.0
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def track_key(track):
+    """Platform-independent identity of a track: normalized name and artist"""
+    name = " ".join(str(track.get('name', '')).lower().split())
+    artist = " ".join(str(track.get('artist', '')).lower().split())
+    return f"{name}\x1f{artist}"
+
+
+class HyperLogLog:
+    """Mergeable distinct-count estimator with 2**p one-byte registers"""
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, item):
+        h = _hash64(item)
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        """Estimate the number of distinct items (Ertl's improved estimator, no bias tables needed)"""
+        q = 64 - self.p
+        histogram = [0] * (q + 2)
+        for r in self.registers:
+            histogram[r] += 1
+        if histogram[0] == self.m:
+            return 0
+        z = self.m * _tau(1 - histogram[q + 1] / self.m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + histogram[k])
+        z += self.m * _sigma(histogram[0] / self.m)
+        return int(round(self.m * self.m / (2 * math.log(2) * z)))
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["p"], base64.b64decode(data["registers"]))
+
+
+class SpaceSaving:
+    """Mergeable heavy-hitters summary that keeps at most k counters"""
+
+    def __init__(self, k=64, counts=None):
+        self.k = k
+        self.counts = dict(counts or {})
+
+    def add(self, item, weight=1):
+        if item in self.counts or len(self.counts) < self.k:
+            self.counts[item] = self.counts.get(item, 0) + weight
+            return
+        smallest = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(smallest)
+        self.counts[item] = floor + weight
+
+    def merge(self, other):
+        merged = dict(self.counts)
+        for item, count in other.counts.items():
+            merged[item] = merged.get(item, 0) + count
+        self.counts = dict(sorted(merged.items(), key=lambda x: x[1], reverse=True)[:self.k])
+        return self
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+
+    def to_dict(self):
+        return {"k": self.k, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["k"], data["counts"])
+
+
+class LibraryAnalytics:
+    """Streaming, mergeable summary of a set of tracks with bounded memory"""
+
+    def __init__(self, p=12, k=64):
+        self.track_count = 0
+        self.tracks = HyperLogLog(p)
+        self.artists = HyperLogLog(p)
+        self.top_artists = SpaceSaving(k)
+        self.top_genres = SpaceSaving(k)
+
+    def add_track(self, track):
+        self.track_count += 1
+        self.tracks.add(track_key(track))
+        artist = track.get('artist')
+        if artist:
+            self.artists.add(artist.lower())
+            self.top_artists.add(artist)
+
+    def add_tracks(self, tracks):
+        for track in tracks:
+            self.add_track(track)
+        return self
+
+    def add_genres(self, genre_counts):
+        for genre, count in genre_counts:
+            self.top_genres.add(genre, count)
+
+    def merge(self, other):
+        self.track_count += other.track_count
+        self.tracks.merge(other.tracks)
+        self.artists.merge(other.artists)
+        self.top_artists.merge(other.top_artists)
+        self.top_genres.merge(other.top_genres)
+        return self
+
+    def summary(self, top_n=10):
+        return {
+            "total_tracks": self.track_count,
+            "unique_tracks": self.tracks.count(),
+            "unique_artists": self.artists.count(),
+            "top_artists": self.top_artists.top(top_n),
+            "top_genres": self.top_genres.top(top_n)
+        }
+
+    def to_dict(self):
+        return {
+            "track_count": self.track_count,
+            "tracks": self.tracks.to_dict(),
+            "artists": self.artists.to_dict(),
+            "top_artists": self.top_artists.to_dict(),
+            "top_genres": self.top_genres.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        analytics = cls()
+        analytics.track_count = data["track_count"]
+        analytics.tracks = HyperLogLog.from_dict(data["tracks"])
+        analytics.artists = HyperLogLog.from_dict(data["artists"])
+        analytics.top_artists = SpaceSaving.from_dict(data["top_artists"])
+        analytics.top_genres = SpaceSaving.from_dict(data["top_genres"])
+        return analytics
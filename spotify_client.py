@@ -3,73 +3,179 @@ from spotipy.oauth2 import SpotifyOAuth
 import os
 import json
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+from metrics import metrics
+from singleflight import SingleFlight
+from metadata_cache import ArtistCache, audio_feature_store
+from recommender import recommender
+from importer import import_into
+from backups import BackupWriter
+from library_mirror import library_mirror
+from search_cache import search_cache
+from progress import progress
+from auth_cache import sessions, profile_cache, TokenRefresher
 
 load_dotenv()
 
 class SpotifyClient:
+    BATCH_WORKERS = 4
+
     def __init__(self):
         self.client_id = os.getenv("SPOTIFY_CLIENT_ID")
         self.client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
         self.redirect_uri = "http://localhost:8888/callback"
         self.scope = "playlist-read-private playlist-modify-public playlist-modify-private user-library-read user-top-read"
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+        self.sp = sessions.get(("spotify", self.client_id, self.scope), self._connect)
+        self._inflight = SingleFlight()
+        self.feature_store = audio_feature_store
+        self.artist_cache = ArtistCache(ttl=float(os.getenv("PLAYSYNC_ARTIST_TTL_DAYS", "30")) * 24 * 3600)
+        self.user_id = self._load_profile()["id"]
+
+    def _connect(self):
+        """Build the API object once per process; its token is kept fresh by a background thread"""
+        sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
             client_id=self.client_id,
             client_secret=self.client_secret,
             redirect_uri=self.redirect_uri,
             scope=self.scope
         ))
-        self.user_id = self.sp.current_user()["id"]
+        metrics.attach_session(getattr(sp, "_session", None))
+        metrics.count_retries(getattr(sp, "_session", None), "spotify")
+        if os.getenv("PLAYSYNC_TOKEN_REFRESH", "1") != "0":
+            TokenRefresher(sp.auth_manager).start()
+        return sp
+
+    def _load_profile(self):
+        """Get the current user's profile, from disk when this login has been seen before"""
+        token = self.sp.auth_manager.cache_handler.get_cached_token()
+        profile = profile_cache.get("spotify", token.get("refresh_token")) if token else None
+        if profile is None:
+            user = self._call("current_user", self.sp.current_user)
+            profile = {"id": user["id"], "display_name": user.get("display_name")}
+            token = self.sp.auth_manager.cache_handler.get_cached_token()
+            if token:
+                profile_cache.set("spotify", token.get("refresh_token"), profile)
+        return profile
+
+    def _call(self, endpoint, func, *args, **kwargs):
+        """Run a Spotify API call through the metrics layer"""
+        return metrics.call("spotify", endpoint, func, *args, **kwargs)
+
+    def _shared_call(self, endpoint, func, *args, **kwargs):
+        """Run a read-only call, sharing the result with identical calls already in flight"""
+        key = (endpoint, args, tuple(sorted(kwargs.items())))
+        return self._inflight.do(key, self._call, endpoint, func, *args, **kwargs)
+
+    def _playlist_items(self, playlist_id):
+        """Get every item of a playlist, following pagination"""
+        items = []
+        offset = 0
+        while True:
+            results = self._shared_call("playlist_tracks", self.sp.playlist_tracks, playlist_id, offset=offset)
+            items.extend(item for item in results['items'] if item.get('track'))
+            if not results.get('next'):
+                return items
+            offset += len(results['items'])
 
     def get_playlist_tracks(self, playlist_url):
         playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        results = self.sp.playlist_tracks(playlist_id)
         tracks = []
-        for item in results['items']:
+        for item in self._playlist_items(playlist_id):
             track = item['track']
             tracks.append({
                 "name": track['name'],
                 "artist": track['artists'][0]['name'],
-                "album": track['album']['name']
+                "album": track['album']['name'],
+                "spotify_id": track.get('id'),
+                "artist_id": track['artists'][0].get('id'),
+                "isrc": track.get('external_ids', {}).get('isrc'),
+                "duration_ms": track.get('duration_ms'),
+                "popularity": track.get('popularity')
             })
+        library_mirror.upsert(tracks)
         return tracks
 
+    def get_playlist_version(self, playlist_url):
+        """Get the playlist snapshot ID, which changes whenever the playlist does"""
+        playlist_id = playlist_url.split("/")[-1].split("?")[0]
+        return self._shared_call("playlist", self.sp.playlist, playlist_id, fields="snapshot_id")['snapshot_id']
+
     def create_playlist(self, name):
-        playlist = self.sp.user_playlist_create(self.user_id, name, public=False)
+        playlist = self._call("create_playlist", self.sp.user_playlist_create, self.user_id, name, public=False)
         return playlist['id']
 
-    def add_tracks(self, playlist_id, tracks):
+    def _search_one(self, query):
+        result = self._shared_call("search", self.sp.search, q=query, type='track', limit=1)
+        items = result['tracks']['items']
+        return items[0]['id'] if items else None
+
+    def resolve_track_ids(self, tracks):
+        """Match tracks to Spotify track IDs, returning one ID (or None) per track
+
+        Tracks that carry a Spotify ID, or whose ID is in the local library
+        mirror, are used as-is and tracks with an ISRC are matched with an
+        exact isrc: search. Only the rest fall back to a name/artist text
+        search. Each distinct lookup runs once, concurrently.
+        """
+        known = [
+            track.get('spotify_id') or local_id
+            for track, local_id in zip(tracks, library_mirror.resolve(tracks, "spotify_id"))
+        ]
+        isrcs = list(dict.fromkeys(
+            track['isrc'].upper() for track, track_id in zip(tracks, known) if not track_id and track.get('isrc')
+        ))
+        with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+            by_isrc = dict(zip(isrcs, executor.map(lambda isrc: self._search_one(f"isrc:{isrc}"), isrcs)))
+            queries = list(dict.fromkeys(
+                f"{track['name']} {track['artist']}" for track, track_id in zip(tracks, known)
+                if not track_id and not by_isrc.get((track.get('isrc') or '').upper())
+            ))
+            by_query = dict(zip(queries, executor.map(self._search_one, queries)))
         track_ids = []
-        for track in tracks:
-            query = f"{track['name']} {track['artist']}"
-            result = self.sp.search(q=query, type='track', limit=1)
-            if result['tracks']['items']:
-                track_ids.append(result['tracks']['items'][0]['id'])
-        if track_ids:
-            self.sp.playlist_add_items(playlist_id, track_ids)
+        for track, track_id in zip(tracks, known):
+            track_id = track_id or by_isrc.get((track.get('isrc') or '').upper())
+            track_ids.append(track_id or by_query.get(f"{track['name']} {track['artist']}"))
+        return track_ids
+
+    def add_tracks(self, playlist_id, tracks):
+        track_ids = [track_id for track_id in self.resolve_track_ids(tracks) if track_id]
+        # The add endpoint takes at most 100 tracks per request
+        for i in range(0, len(track_ids), 100):
+            self._call("add_items", self.sp.playlist_add_items, playlist_id, track_ids[i:i + 100])
         return len(track_ids)
 
+    def get_tracks(self, track_ids):
+        """Get track details for Spotify track IDs"""
+        tracks = []
+        for tracks_info in self._batched("tracks", self.sp.tracks, list(track_ids), 50):
+            for track in tracks_info['tracks']:
+                if track:
+                    tracks.append({
+                        "spotify_id": track['id'],
+                        "name": track['name'],
+                        "artist": track['artists'][0]['name'] if track['artists'] else "Unknown",
+                        "album": track['album']['name'],
+                        "duration_ms": track['duration_ms'],
+                        "popularity": track['popularity']
+                    })
+        library_mirror.upsert(tracks)
+        return tracks
+
     # NEW FUNCTIONS
 
-    def analyze_playlist(self, playlist_url):
-        """Get detailed statistics about a playlist"""
+    def analyze_playlist(self, playlist_url, tracks=None):
+        """Get detailed statistics about a playlist, reusing its tracks if the caller already fetched them"""
         playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        playlist_info = self.sp.playlist(playlist_id)
-        tracks = self.get_playlist_tracks(playlist_url)
+        playlist_info = self._shared_call("playlist", self.sp.playlist, playlist_id)
+        if tracks is None:
+            tracks = self.get_playlist_tracks(playlist_url)
         
         # Get audio features for tracks
-        track_ids = []
-        for track in tracks:
-            query = f"{track['name']} {track['artist']}"
-            result = self.sp.search(q=query, type='track', limit=1)
-            if result['tracks']['items']:
-                track_ids.append(result['tracks']['items'][0]['id'])
+        track_ids = [track_id for track_id in self.resolve_track_ids(tracks) if track_id]
         
-        audio_features = []
-        if track_ids:
-            features = self.sp.audio_features(track_ids)
-            audio_features = [f for f in features if f is not None]
+        audio_features = self.get_audio_features(track_ids)
         
         # Calculate statistics
         stats = {
@@ -81,7 +187,7 @@ class SpotifyClient:
             "avg_danceability": sum(f.get('danceability', 0) for f in audio_features) / len(audio_features) if audio_features else 0,
             "avg_valence": sum(f.get('valence', 0) for f in audio_features) / len(audio_features) if audio_features else 0,
             "top_artists": self._get_top_artists(tracks),
-            "top_genres": self._get_top_genres(track_ids),
+            "top_genres": self._get_top_genres(tracks),
             "created_by": playlist_info.get('owner', {}).get('display_name', 'Unknown'),
             "public": playlist_info.get('public', False),
             "collaborative": playlist_info.get('collaborative', False)
@@ -98,35 +204,53 @@ class SpotifyClient:
         
         return sorted(artist_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
 
-    def _get_top_genres(self, track_ids, top_n=5):
+    def _get_top_genres(self, tracks, top_n=5):
         """Get top genres from playlist"""
-        if not track_ids:
-            return []
-        
-        # Get artist IDs
-        tracks_info = self.sp.tracks(track_ids)
-        artist_ids = []
-        for track in tracks_info['tracks']:
-            if track and track['artists']:
-                artist_ids.append(track['artists'][0]['id'])
-        
+        genre_counts = self.genre_counts(tracks)
+        return sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
+
+    def genre_counts(self, tracks):
+        """Count artist genres over tracks listed with an artist_id; cached artists cost no API calls"""
+        artist_ids = [track['artist_id'] for track in tracks if track.get('artist_id')]
         if not artist_ids:
-            return []
+            return {}
         
-        # Get artist genres
-        artists_info = self.sp.artists(artist_ids)
+        artists = self._get_artists(artist_ids)
         genre_counts = {}
-        for artist in artists_info['artists']:
-            for genre in artist.get('genres', []):
+        for artist_id in artist_ids:
+            for genre in artists.get(artist_id, {}).get('genres', []):
                 genre_counts[genre] = genre_counts.get(genre, 0) + 1
-        
-        return sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        return genre_counts
+
+    def _batched(self, endpoint, func, ids, size):
+        """Call a multi-ID endpoint in parallel chunks of at most size IDs"""
+        chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+        if len(chunks) <= 1:
+            return [self._call(endpoint, func, chunk) for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as pool:
+            return list(pool.map(lambda chunk: self._call(endpoint, func, chunk), chunks))
+
+    def _get_artists(self, artist_ids):
+        """Get artist metadata by ID, requesting only artists missing from the artist cache"""
+        unique_ids = list(dict.fromkeys(artist_ids))
+        artists = self.artist_cache.get_many(unique_ids)
+        missing = [artist_id for artist_id in unique_ids if artist_id not in artists]
+        for artists_info in self._batched("artists", self.sp.artists, missing, 50):
+            fetched = [artist for artist in artists_info['artists'] if artist]
+            self.artist_cache.put_many(fetched)
+            for artist in fetched:
+                artists[artist['id']] = {
+                    "name": artist.get('name', ''),
+                    "genres": artist.get('genres', []),
+                    "popularity": artist.get('popularity', 0)
+                }
+        return artists
 
     def export_playlist(self, playlist_url, format='json'):
         """Export playlist to various formats"""
         tracks = self.get_playlist_tracks(playlist_url)
         playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        playlist_info = self.sp.playlist(playlist_id)
+        playlist_info = self._shared_call("playlist", self.sp.playlist, playlist_id)
         
         if format == 'json':
             data = {
@@ -161,29 +285,15 @@ class SpotifyClient:
             return filename
 
     def import_playlist(self, filename, playlist_name=None):
-        """Import playlist from JSON file"""
-        with open(filename, 'r') as f:
-            data = json.load(f)
-        
-        playlist_data = data.get('playlist', data)
-        tracks = playlist_data['tracks']
-        name = playlist_name or playlist_data.get('name', 'Imported Playlist')
-        
-        playlist_id = self.create_playlist(name)
-        added_count = self.add_tracks(playlist_id, tracks)
-        
-        return {
-            "playlist_id": playlist_id,
-            "name": name,
-            "tracks_added": added_count,
-            "total_tracks": len(tracks)
-        }
+        """Import playlist from a JSON, CSV or TXT export, adding tracks as they are read"""
+        return import_into(self, filename, playlist_name)
 
     def delete_playlist(self, playlist_url):
         """Delete a playlist"""
         playlist_id = playlist_url.split("/")[-1].split("?")[0]
         try:
-            self.sp.user_playlist_unfollow(self.user_id, playlist_id)
+            self._call("unfollow_playlist", self.sp.user_playlist_unfollow, self.user_id, playlist_id)
+            recommender.remove_playlist("spotify", playlist_id)
             return True
         except Exception as e:
             print(f"Error deleting playlist: {e}")
@@ -193,7 +303,7 @@ class SpotifyClient:
         """Rename a playlist"""
         playlist_id = playlist_url.split("/")[-1].split("?")[0]
         try:
-            self.sp.user_playlist_change_details(playlist_id, name=new_name)
+            self._call("change_details", self.sp.user_playlist_change_details, playlist_id, name=new_name)
             return True
         except Exception as e:
             print(f"Error renaming playlist: {e}")
@@ -203,7 +313,7 @@ class SpotifyClient:
         """Duplicate a playlist"""
         tracks = self.get_playlist_tracks(playlist_url)
         playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        playlist_info = self.sp.playlist(playlist_id)
+        playlist_info = self._shared_call("playlist", self.sp.playlist, playlist_id)
         
         name = new_name or f"{playlist_info['name']} (Copy)"
         new_playlist_id = self.create_playlist(name)
@@ -217,18 +327,38 @@ class SpotifyClient:
         }
 
     def search_tracks(self, query, limit=20):
-        """Search for tracks"""
-        results = self.sp.search(q=query, type='track', limit=limit)
+        """Search for tracks, answering from the search cache or the local library mirror when they can"""
+        cached = search_cache.get("spotify", query, limit)
+        if cached is not None:
+            return cached
+        if ":" not in query:
+            local = library_mirror.search(query, limit, ("spotify_id", "duration_ms", "popularity"))
+            if len(local) >= limit:
+                return [{
+                    "id": row['spotify_id'],
+                    "spotify_id": row['spotify_id'],
+                    "isrc": row['isrc'],
+                    "name": row['name'],
+                    "artist": row['artist'],
+                    "album": row['album'],
+                    "duration_ms": row['duration_ms'],
+                    "popularity": row['popularity']
+                } for row in local]
+        results = self._shared_call("search", self.sp.search, q=query, type='track', limit=limit)
         tracks = []
         for track in results['tracks']['items']:
             tracks.append({
                 "id": track['id'],
+                "spotify_id": track['id'],
+                "isrc": track.get('external_ids', {}).get('isrc'),
                 "name": track['name'],
                 "artist": track['artists'][0]['name'],
                 "album": track['album']['name'],
                 "duration_ms": track['duration_ms'],
                 "popularity": track['popularity']
             })
+        library_mirror.upsert(tracks)
+        search_cache.set("spotify", query, limit, tracks)
         return tracks
 
     def get_recommendations(self, seed_tracks=None, seed_artists=None, seed_genres=None, limit=20):
@@ -236,7 +366,8 @@ class SpotifyClient:
         if not any([seed_tracks, seed_artists, seed_genres]):
             return []
         
-        recommendations = self.sp.recommendations(
+        recommendations = self._call(
+            "recommendations", self.sp.recommendations,
             seed_tracks=seed_tracks[:5] if seed_tracks else None,
             seed_artists=seed_artists[:5] if seed_artists else None,
             seed_genres=seed_genres[:5] if seed_genres else None,
@@ -257,7 +388,7 @@ class SpotifyClient:
     def get_user_playlists(self):
         """Get all user playlists"""
         playlists = []
-        results = self.sp.current_user_playlists()
+        results = self._call("user_playlists", self.sp.current_user_playlists)
         
         for playlist in results['items']:
             playlists.append({
@@ -271,9 +402,30 @@ class SpotifyClient:
         return playlists
 
     def get_audio_features(self, track_ids):
-        """Get audio features for tracks"""
-        features = self.sp.audio_features(track_ids)
-        return [f for f in features if f is not None]
+        """Get audio features for tracks, requesting only tracks missing from the feature store"""
+        features = self.feature_store.get_many(track_ids)
+        missing = list(dict.fromkeys(t for t in track_ids if t not in features))
+        if missing:
+            fetched = {}
+            for batch in self._batched("audio_features", self.sp.audio_features, missing, 100):
+                for feature in batch:
+                    if feature is not None:
+                        fetched[feature['id']] = feature
+            for track_id in missing:
+                features[track_id] = fetched.get(track_id)
+            self.feature_store.put_many({track_id: features[track_id] for track_id in missing})
+        return [features[t] for t in track_ids if features.get(t) is not None]
+
+    def cache_library_features(self):
+        """Fill the audio feature store with every track in the user's playlists"""
+        track_ids = []
+        for playlist in self.get_user_playlists():
+            try:
+                track_ids.extend(item['track']['id'] for item in self._playlist_items(playlist['id'])
+                                 if item['track'].get('id'))
+            except Exception as e:
+                print(f"Error reading playlist {playlist['name']}: {e}")
+        return len(self.get_audio_features(list(dict.fromkeys(track_ids))))
 
     def create_playlist_from_search(self, query, playlist_name, limit=20):
         """Create a playlist from search results"""
@@ -283,7 +435,7 @@ class SpotifyClient:
         
         playlist_id = self.create_playlist(playlist_name)
         track_ids = [track['id'] for track in tracks]
-        self.sp.playlist_add_items(playlist_id, track_ids)
+        self._call("add_items", self.sp.playlist_add_items, playlist_id, track_ids)
         
         return {
             "playlist_id": playlist_id,
@@ -293,38 +445,33 @@ class SpotifyClient:
 
     def backup_playlists(self, backup_dir="playlist_backups"):
         """Backup all user playlists"""
-        import os
-        os.makedirs(backup_dir, exist_ok=True)
-        
         playlists = self.get_user_playlists()
-        backup_info = {
-            "backup_date": datetime.now().isoformat(),
-            "total_playlists": len(playlists),
-            "playlists": []
-        }
         
-        for playlist in playlists:
-            try:
-                tracks = self.get_playlist_tracks(playlist['url'])
-                playlist_data = {
-                    "id": playlist['id'],
-                    "name": playlist['name'],
-                    "tracks_count": playlist['tracks_count'],
-                    "tracks": tracks
-                }
-                backup_info["playlists"].append(playlist_data)
-                
-                # Save individual playlist
-                filename = f"{backup_dir}/playlist_{playlist['id']}.json"
-                with open(filename, 'w') as f:
-                    json.dump(playlist_data, f, indent=2)
+        with progress.job("Spotify backup", total=len(playlists)) as job, \
+                BackupWriter(backup_dir, len(playlists)) as writer:
+            for playlist in playlists:
+                try:
+                    job.set_phase(playlist['name'])
+                    tracks = self.get_playlist_tracks(playlist['url'])
+                    playlist_data = {
+                        "id": playlist['id'],
+                        "name": playlist['name'],
+                        "tracks_count": playlist['tracks_count'],
+                        "tracks": tracks
+                    }
+                    writer.add(playlist_data)
+                    recommender.update_playlist("spotify", playlist['id'], tracks)
                     
-            except Exception as e:
-                print(f"Error backing up playlist {playlist['name']}: {e}")
-        
-        # Save backup summary
-        summary_file = f"{backup_dir}/backup_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(summary_file, 'w') as f:
-            json.dump(backup_info, f, indent=2)
+                    # Save individual playlist
+                    filename = f"{backup_dir}/playlist_{playlist['id']}.json"
+                    with open(filename, 'w') as f:
+                        json.dump(playlist_data, f, indent=2)
+                    job.advance(tracks=len(tracks))
+                        
+                except Exception as e:
+                    print(f"Error backing up playlist {playlist['name']}: {e}")
+                    job.advance()
         
-        return summary_file
\ No newline at end of file
+            job.set_phase("saving recommendations")
+            recommender.save()
+        return writer.summary_file
\ No newline at end of file
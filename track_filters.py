@@ -0,0 +1,240 @@
+import operator
+import re
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|<=|>=|<|>|=|\[|\]|\(|\)|,)
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_COMPARISONS = {
+    "==": operator.eq, "=": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge
+}
+_KEYWORDS = {"and", "or", "not", "in", "contains", "true", "false"}
+_TEXT_FIELDS = {"name", "artist", "album", "id", "isrc"}
+_SEARCH_FIELDS = {"artist": "artist", "album": "album", "name": "track"}
+
+
+class FilterSyntaxError(ValueError):
+    pass
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise FilterSyntaxError(f"Unexpected input at position {position}: {text[position:position + 10]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "number":
+            value = float(value) if "." in value else int(value)
+        elif kind == "string":
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        elif kind == "word" and value.lower() in _KEYWORDS:
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser producing a small tuple-based AST"""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self, kind=None, value=None):
+        token = self._peek()
+        if token[0] is None or (kind and token[0] != kind) or (value is not None and token[1] != value):
+            expected = value or kind or "token"
+            raise FilterSyntaxError(f"Expected {expected} but found {token[1]!r}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self._or()
+        if self._peek()[0] is not None:
+            raise FilterSyntaxError(f"Unexpected {self._peek()[1]!r}")
+        return node
+
+    def _or(self):
+        nodes = [self._and()]
+        while self._peek() == ("keyword", "or"):
+            self._take()
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def _and(self):
+        nodes = [self._not()]
+        while self._peek() == ("keyword", "and"):
+            self._take()
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def _not(self):
+        if self._peek() == ("keyword", "not"):
+            self._take()
+            return ("not", self._not())
+        return self._comparison()
+
+    def _comparison(self):
+        if self._peek() == ("op", "("):
+            self._take()
+            node = self._or()
+            self._take("op", ")")
+            return node
+        field = self._take("word")[1]
+        kind, value = self._peek()
+        if (kind, value) == ("keyword", "not"):
+            self._take()
+            self._take("keyword", "in")
+            return ("not", ("in", field, self._list()))
+        if (kind, value) == ("keyword", "in"):
+            self._take()
+            return ("in", field, self._list())
+        if (kind, value) == ("keyword", "contains"):
+            self._take()
+            return ("contains", field, str(self._value()).lower())
+        if kind == "op" and value in _COMPARISONS:
+            self._take()
+            return ("cmp", field, value, self._value())
+        raise FilterSyntaxError(f"Expected an operator after {field!r}")
+
+    def _list(self):
+        self._take("op", "[")
+        values = []
+        if self._peek() != ("op", "]"):
+            values.append(self._value())
+            while self._peek() == ("op", ","):
+                self._take()
+                values.append(self._value())
+        self._take("op", "]")
+        return frozenset(values)
+
+    def _value(self):
+        kind, value = self._peek()
+        if kind in ("number", "string", "word"):
+            self._take()
+            return value
+        if kind == "keyword" and value in ("true", "false"):
+            self._take()
+            return value == "true"
+        raise FilterSyntaxError(f"Expected a value but found {value!r}")
+
+
+def _default(field):
+    return "" if field in _TEXT_FIELDS else 0
+
+
+def _compile(node):
+    """Turn an AST node into a single predicate over a track dict"""
+    kind = node[0]
+    if kind == "and":
+        parts = [_compile(child) for child in node[1]]
+        return lambda track: all(part(track) for part in parts)
+    if kind == "or":
+        parts = [_compile(child) for child in node[1]]
+        return lambda track: any(part(track) for part in parts)
+    if kind == "not":
+        inner = _compile(node[1])
+        return lambda track: not inner(track)
+    field = node[1]
+    default = _default(field)
+    if kind == "in":
+        values = node[2]
+        return lambda track: track.get(field, default) in values
+    if kind == "contains":
+        needle = node[2]
+        return lambda track: needle in str(track.get(field, default)).lower()
+    compare, value = _COMPARISONS[node[2]], node[3]
+
+    def predicate(track):
+        try:
+            return compare(track.get(field, default), value)
+        except TypeError:
+            return False
+    return predicate
+
+
+class TrackFilter:
+    """A compiled track filter expression
+
+    Example: popularity >= 60 and artist not in ["A", "B"] and duration_ms < 240000
+    """
+
+    def __init__(self, expression=None, tree=None):
+        self.expression = expression
+        self.tree = tree if tree is not None else (_Parser(expression).parse() if expression and expression.strip() else None)
+        self._predicate = _compile(self.tree) if self.tree is not None else (lambda track: True)
+
+    @classmethod
+    def from_dict(cls, filters):
+        """Build a filter from the legacy dict form (min_popularity, max_duration_ms, ...)"""
+        conditions = []
+        if filters.get('min_popularity'):
+            conditions.append(("cmp", "popularity", ">=", filters['min_popularity']))
+        if filters.get('max_duration_ms'):
+            conditions.append(("cmp", "duration_ms", "<=", filters['max_duration_ms']))
+        if filters.get('exclude_artists'):
+            conditions.append(("not", ("in", "artist", frozenset(filters['exclude_artists']))))
+        if filters.get('include_artists'):
+            conditions.append(("in", "artist", frozenset(filters['include_artists'])))
+        if filters.get('expression'):
+            conditions.append(_Parser(filters['expression']).parse())
+        if not conditions:
+            return cls()
+        return cls(tree=conditions[0] if len(conditions) == 1 else ("and", conditions))
+
+    def matches(self, track):
+        return self._predicate(track)
+
+    def apply(self, tracks):
+        """Filter tracks in a single pass"""
+        if self.tree is None:
+            return list(tracks)
+        predicate = self._predicate
+        return [track for track in tracks if predicate(track)]
+
+    def search_qualifiers(self):
+        """Spotify-style search field filters implied by conditions every match must meet, for push-down"""
+        if self.tree is None:
+            return []
+        # Conditions under nested ANDs (e.g. an expression combined with guided filters) must hold too
+        conditions = []
+        pending = [self.tree]
+        while pending:
+            node = pending.pop()
+            if node[0] == "and":
+                pending.extend(reversed(node[1]))
+            else:
+                conditions.append(node)
+        qualifiers = []
+        for node in conditions:
+            if node[0] == "cmp" and node[2] in ("==", "=") and node[1] in _SEARCH_FIELDS:
+                values = [node[3]]
+            elif node[0] == "in" and node[1] in _SEARCH_FIELDS and len(node[2]) == 1:
+                values = list(node[2])
+            else:
+                continue
+            value = str(values[0]).replace('"', '')
+            qualifiers.append(f'{_SEARCH_FIELDS[node[1]]}:"{value}"')
+        return qualifiers
+
+
+def compile_filter(filters):
+    """Compile a filter expression string or legacy filter dict"""
+    if isinstance(filters, TrackFilter):
+        return filters
+    if isinstance(filters, str):
+        return TrackFilter(filters)
+    return TrackFilter.from_dict(filters or {})
@@ -3,41 +3,57 @@ import csv
 import os
 from datetime import datetime
 from typing import List, Dict, Any, Optional
+from profiler import profiled
+from analysis_cache import analysis_cache
+from sketches import LibraryAnalytics
+from track_filters import compile_filter
+from audio_index import AudioFeatureIndex
+from similarity import PlaylistSimilarity
+from progress import progress
 
 class PlaylistUtils:
     """Utility class for advanced playlist operations"""
     
+    _audio_index = None
+    
     @staticmethod
+    @profiled()
     def batch_convert_playlists(source_client, source_playlists, target_clients):
         """Convert multiple playlists at once"""
         results = []
-        for playlist_info in source_playlists:
-            try:
-                tracks = source_client.get_playlist_tracks(playlist_info['id'])
-                playlist_name = f"{playlist_info['name']} (Converted)"
-                
-                for target_client, target_type in target_clients.items():
-                    playlist_id = target_client.create_playlist(playlist_name)
-                    added_count = target_client.add_tracks(playlist_id, tracks)
+        with progress.job("batch convert", total=len(source_playlists)) as job:
+            for playlist_info in source_playlists:
+                try:
+                    job.set_phase(f"fetching {playlist_info['name']}")
+                    tracks = source_client.get_playlist_tracks(playlist_info['id'])
+                    playlist_name = f"{playlist_info['name']} (Converted)"
                     
+                    for target_type, target_client in target_clients.items():
+                        job.set_phase(f"writing {playlist_info['name']} to {target_type}")
+                        playlist_id = target_client.create_playlist(playlist_name)
+                        added_count = target_client.add_tracks(playlist_id, tracks)
+                        
+                        results.append({
+                            "source_playlist": playlist_info['name'],
+                            "target_platform": target_type,
+                            "playlist_id": playlist_id,
+                            "tracks_added": added_count,
+                            "status": "success"
+                        })
+                    job.advance(tracks=len(tracks))
+                except Exception as e:
                     results.append({
                         "source_playlist": playlist_info['name'],
-                        "target_platform": target_type,
-                        "playlist_id": playlist_id,
-                        "tracks_added": added_count,
-                        "status": "success"
+                        "target_platform": "all",
+                        "error": str(e),
+                        "status": "failed"
                     })
-            except Exception as e:
-                results.append({
-                    "source_playlist": playlist_info['name'],
-                    "target_platform": "all",
-                    "error": str(e),
-                    "status": "failed"
-                })
+                    job.advance()
         
         return results
 
     @staticmethod
+    @profiled()
     def analyze_multiple_playlists(clients, playlist_data):
         """Analyze multiple playlists across platforms"""
         analysis_results = {}
@@ -49,14 +65,15 @@ class PlaylistUtils:
             for playlist_info in playlists:
                 try:
                     if platform == "Spotify":
-                        stats = client.analyze_playlist(playlist_info['url'])
+                        stats, sketch = analysis_cache.analyze(client, platform, playlist_info['url'])
                     else:
-                        stats = client.analyze_playlist(playlist_info['id'])
+                        stats, sketch = analysis_cache.analyze(client, platform, playlist_info['id'])
                     
                     if stats:
                         analysis_results[platform].append({
                             "playlist_name": playlist_info['name'],
-                            "stats": stats
+                            "stats": stats,
+                            "sketch": sketch
                         })
                 except Exception as e:
                     analysis_results[platform].append({
@@ -67,15 +84,21 @@ class PlaylistUtils:
         return analysis_results
 
     @staticmethod
+    @profiled()
     def create_smart_playlist(clients, criteria, target_platform, playlist_name):
         """Create a playlist based on smart criteria"""
         all_tracks = []
+        track_filter = compile_filter(criteria.get('filters', {}))
         
         # Collect tracks from all platforms based on criteria
         for platform, client in clients.items():
             try:
                 if criteria.get('search_query'):
-                    tracks = client.search_tracks(criteria['search_query'], criteria.get('limit', 20))
+                    query = criteria['search_query']
+                    if platform == "Spotify":
+                        # Let Spotify apply artist/album/track conditions server-side
+                        query = " ".join([query] + track_filter.search_qualifiers())
+                    tracks = client.search_tracks(query, criteria.get('limit', 20))
                     all_tracks.extend(tracks)
                 
                 if criteria.get('playlist_id'):
@@ -85,7 +108,7 @@ class PlaylistUtils:
                 print(f"Error collecting tracks from {platform}: {e}")
         
         # Apply filters
-        filtered_tracks = PlaylistUtils._apply_track_filters(all_tracks, criteria.get('filters', {}))
+        filtered_tracks = PlaylistUtils._apply_track_filters(all_tracks, track_filter)
         
         # Create playlist on target platform
         target_client = clients[target_platform]
@@ -101,26 +124,11 @@ class PlaylistUtils:
 
     @staticmethod
     def _apply_track_filters(tracks, filters):
-        """Apply filters to track list"""
-        filtered_tracks = tracks
-        
-        if filters.get('min_popularity'):
-            filtered_tracks = [t for t in filtered_tracks if t.get('popularity', 0) >= filters['min_popularity']]
-        
-        if filters.get('max_duration_ms'):
-            filtered_tracks = [t for t in filtered_tracks if t.get('duration_ms', 0) <= filters['max_duration_ms']]
-        
-        if filters.get('exclude_artists'):
-            excluded = set(filters['exclude_artists'])
-            filtered_tracks = [t for t in filtered_tracks if t.get('artist', '') not in excluded]
-        
-        if filters.get('include_artists'):
-            included = set(filters['include_artists'])
-            filtered_tracks = [t for t in filtered_tracks if t.get('artist', '') in included]
-        
-        return filtered_tracks
+        """Apply a filter expression, legacy filter dict or compiled TrackFilter in one pass"""
+        return compile_filter(filters).apply(tracks)
 
     @staticmethod
+    @profiled()
     def generate_playlist_report(analysis_results, output_format='json'):
         """Generate a comprehensive report from playlist analysis"""
         report = {
@@ -133,35 +141,39 @@ class PlaylistUtils:
             "cross_platform_insights": {}
         }
         
-        # Platform-specific details
+        # Platform-specific details, merged from per-playlist track sketches
+        library = LibraryAnalytics()
         for platform, playlists in analysis_results.items():
-            total_tracks = 0
+            platform_analytics = LibraryAnalytics()
             total_duration = 0
-            all_artists = []
             
             for playlist in playlists:
                 if 'stats' in playlist:
-                    stats = playlist['stats']
-                    total_tracks += stats.get('total_tracks', 0)
-                    total_duration += stats.get('duration_ms', 0)
-                    all_artists.extend([artist[0] for artist in stats.get('top_artists', [])])
+                    total_duration += playlist['stats'].get('duration_ms', 0)
+                if playlist.get('sketch'):
+                    platform_analytics.merge(LibraryAnalytics.from_dict(playlist['sketch']))
             
+            library.merge(platform_analytics)
+            summary = platform_analytics.summary(10)
             report["platform_details"][platform] = {
                 "total_playlists": len(playlists),
-                "total_tracks": total_tracks,
+                "total_tracks": summary["total_tracks"],
+                "unique_tracks": summary["unique_tracks"],
+                "unique_artists": summary["unique_artists"],
                 "total_duration_ms": total_duration,
-                "top_artists": PlaylistUtils._get_top_items(all_artists, 10)
+                "top_artists": summary["top_artists"],
+                "top_genres": summary["top_genres"]
             }
         
         # Cross-platform insights
-        all_platform_artists = []
-        for platform_data in report["platform_details"].values():
-            all_platform_artists.extend(platform_data["top_artists"])
-        
+        summary = library.summary(15)
         report["cross_platform_insights"] = {
-            "overall_top_artists": PlaylistUtils._get_top_items(all_platform_artists, 15),
-            "total_unique_tracks": sum(pd["total_tracks"] for pd in report["platform_details"].values())
+            "overall_top_artists": summary["top_artists"],
+            "overall_top_genres": summary["top_genres"],
+            "total_unique_tracks": summary["unique_tracks"],
+            "total_unique_artists": summary["unique_artists"]
         }
+        report["analysis_cache"] = analysis_cache.stats()
         
         # Save report
         if output_format == 'json':
@@ -172,17 +184,30 @@ class PlaylistUtils:
             filename = f"playlist_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
             with open(filename, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow(['Platform', 'Playlists', 'Total Tracks', 'Top Artist'])
+                writer.writerow(['Platform', 'Playlists', 'Total Tracks', 'Unique Tracks', 'Top Artist'])
                 for platform, data in report["platform_details"].items():
                     writer.writerow([
                         platform,
                         data["total_playlists"],
                         data["total_tracks"],
+                        data["unique_tracks"],
                         data["top_artists"][0] if data["top_artists"] else "N/A"
                     ])
+                cache_stats = report["analysis_cache"]
+                writer.writerow([])
+                writer.writerow(['Analysis Cache Hits', 'Misses', 'Hit Ratio'])
+                writer.writerow([cache_stats["hits"], cache_stats["misses"], cache_stats["hit_ratio"]])
         
         return filename
 
+    @staticmethod
+    def _get_audio_index(feature_store):
+        """Get a KD-tree over the feature store, rebuilt only when the store has grown"""
+        index = PlaylistUtils._audio_index
+        if index is None or index[0] != len(feature_store):
+            index = PlaylistUtils._audio_index = (len(feature_store), AudioFeatureIndex.from_store(feature_store))
+        return index[1]
+
     @staticmethod
     def _get_top_items(items, top_n):
         """Get top N items by frequency"""
@@ -193,44 +218,51 @@ class PlaylistUtils:
         return sorted(item_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
 
     @staticmethod
+    @profiled()
     def sync_playlists_across_platforms(clients, sync_config):
         """Sync playlists across multiple platforms"""
         results = []
         
-        for sync_rule in sync_config:
-            try:
-                source_platform = sync_rule['source_platform']
-                target_platforms = sync_rule['target_platforms']
-                playlist_id = sync_rule['playlist_id']
-                
-                source_client = clients[source_platform]
-                tracks = source_client.get_playlist_tracks(playlist_id)
-                
-                for target_platform in target_platforms:
-                    target_client = clients[target_platform]
-                    playlist_name = f"{sync_rule.get('name', 'Synced Playlist')} ({target_platform})"
+        with progress.job("sync", total=len(sync_config)) as job:
+            for sync_rule in sync_config:
+                try:
+                    source_platform = sync_rule['source_platform']
+                    target_platforms = sync_rule['target_platforms']
+                    playlist_id = sync_rule['playlist_id']
                     
-                    playlist_id = target_client.create_playlist(playlist_name)
-                    added_count = target_client.add_tracks(playlist_id, tracks)
+                    job.set_phase(f"fetching {sync_rule.get('name', playlist_id)} from {source_platform}")
+                    source_client = clients[source_platform]
+                    tracks = source_client.get_playlist_tracks(playlist_id)
                     
+                    for target_platform in target_platforms:
+                        job.set_phase(f"writing {sync_rule.get('name', playlist_id)} to {target_platform}")
+                        target_client = clients[target_platform]
+                        playlist_name = f"{sync_rule.get('name', 'Synced Playlist')} ({target_platform})"
+                        
+                        playlist_id = target_client.create_playlist(playlist_name)
+                        added_count = target_client.add_tracks(playlist_id, tracks)
+                        
+                        results.append({
+                            "source_platform": source_platform,
+                            "target_platform": target_platform,
+                            "playlist_name": playlist_name,
+                            "tracks_added": added_count,
+                            "status": "success"
+                        })
+                    job.advance(tracks=len(tracks))
+                        
+                except Exception as e:
                     results.append({
-                        "source_platform": source_platform,
-                        "target_platform": target_platform,
-                        "playlist_name": playlist_name,
-                        "tracks_added": added_count,
-                        "status": "success"
+                        "source_platform": sync_rule.get('source_platform', 'Unknown'),
+                        "error": str(e),
+                        "status": "failed"
                     })
-                    
-            except Exception as e:
-                results.append({
-                    "source_platform": sync_rule.get('source_platform', 'Unknown'),
-                    "error": str(e),
-                    "status": "failed"
-                })
+                    job.advance()
         
         return results
 
     @staticmethod
+    @profiled()
     def create_playlist_from_recommendations(clients, seed_playlist_info, target_platform, playlist_name, limit=20):
         """Create a playlist from recommendations based on a seed playlist"""
         try:
@@ -267,6 +299,7 @@ class PlaylistUtils:
             return None
 
     @staticmethod
+    @profiled()
     def export_playlist_collection(clients, playlist_collection, format='json'):
         """Export a collection of playlists from multiple platforms"""
         collection_data = {
@@ -312,6 +345,7 @@ class PlaylistUtils:
         return filename
 
     @staticmethod
+    @profiled()
     def compare_playlist_audio_features(clients, playlist_data):
         """Compare audio features across playlists"""
         comparison_results = {}
@@ -323,9 +357,9 @@ class PlaylistUtils:
             for playlist_info in playlists:
                 try:
                     if platform == "Spotify":
-                        stats = client.analyze_playlist(playlist_info['url'])
+                        stats, sketch = analysis_cache.analyze(client, platform, playlist_info['url'])
                     else:
-                        stats = client.analyze_playlist(playlist_info['id'])
+                        stats, sketch = analysis_cache.analyze(client, platform, playlist_info['id'])
                     
                     if stats:
                         audio_features = {
@@ -347,22 +381,42 @@ class PlaylistUtils:
         return comparison_results
 
     @staticmethod
+    @profiled()
     def create_playlist_from_audio_criteria(clients, criteria, target_platform, playlist_name):
-        """Create a playlist based on audio feature criteria"""
-        all_tracks = []
+        """Create a playlist based on audio feature criteria
         
-        # This would require getting audio features for tracks
-        # For now, this is a placeholder implementation
-        for platform, client in clients.items():
+        criteria may contain a 'target' profile ({feature: value}) to find the
+        nearest tracks, 'ranges' ({feature: [low, high]}) that every track must
+        fall within, and an optional 'search_query' whose Spotify results are
+        added to the local audio feature index first.
+        """
+        spotify = clients.get("Spotify")
+        if spotify is None:
+            print("Audio feature criteria need a Spotify client")
+            return None
+        limit = criteria.get('limit', 20)
+        
+        if criteria.get('search_query'):
             try:
-                if criteria.get('search_query'):
-                    tracks = client.search_tracks(criteria['search_query'], criteria.get('limit', 50))
-                    all_tracks.extend(tracks)
+                found = spotify.search_tracks(criteria['search_query'], criteria.get('search_limit', 50))
+                spotify.get_audio_features([track['id'] for track in found])
             except Exception as e:
-                print(f"Error searching tracks on {platform}: {e}")
+                print(f"Error searching tracks on Spotify: {e}")
         
-        # Filter by audio criteria (placeholder)
-        filtered_tracks = all_tracks[:criteria.get('limit', 20)]
+        index = PlaylistUtils._get_audio_index(spotify.feature_store)
+        if not len(index):
+            print("No tracks with audio features yet; cache your library's features or add a search query")
+            return None
+        ranges = {field: tuple(bounds) for field, bounds in criteria.get('ranges', {}).items()}
+        if criteria.get('target'):
+            allowed = set(index.within(ranges)) if ranges else None
+            track_ids = [track_id for track_id, _ in index.nearest(criteria['target'], limit, allowed)]
+        else:
+            track_ids = index.within(ranges, limit)
+        if not track_ids:
+            print("No tracks match the audio criteria")
+            return None
+        filtered_tracks = spotify.get_tracks(track_ids)
         
         # Create playlist
         target_client = clients[target_platform]
@@ -374,4 +428,42 @@ class PlaylistUtils:
             "name": playlist_name,
             "tracks_added": added_count,
             "criteria_used": criteria
-        } 
\ No newline at end of file
+        }
+
+    @staticmethod
+    @profiled()
+    def find_similar_playlists(clients, threshold=0.5):
+        """Find near-duplicate and heavily overlapping playlists across all platforms
+
+        Returns verified pairs (Jaccard >= threshold) and clusters of connected playlists.
+        """
+        similarity = PlaylistSimilarity(threshold)
+        errors = []
+        for platform, client in clients.items():
+            try:
+                playlists = client.get_user_playlists()
+            except Exception as e:
+                errors.append({"platform": platform, "error": str(e)})
+                continue
+            for playlist_info in playlists:
+                try:
+                    tracks = client.get_playlist_tracks(playlist_info.get('url') or playlist_info['id'])
+                    similarity.add(f"{platform}:{playlist_info['id']}", tracks,
+                                   platform=platform, id=playlist_info['id'], name=playlist_info['name'])
+                except Exception as e:
+                    errors.append({"platform": platform, "playlist_name": playlist_info['name'], "error": str(e)})
+        
+        def describe(key):
+            info = similarity.playlists[key]
+            return {"platform": info['platform'], "id": info['id'], "name": info['name'], "tracks": len(info['tracks'])}
+        
+        pairs = similarity.pairs()
+        return {
+            "playlists_compared": len(similarity.playlists),
+            "pairs": [
+                {"a": describe(pair['a']), "b": describe(pair['b']), "jaccard": pair['jaccard']}
+                for pair in pairs
+            ],
+            "clusters": [[describe(key) for key in cluster] for cluster in similarity.clusters(pairs)],
+            "errors": errors
+        }
@@ -2,49 +2,124 @@ from ytmusicapi import YTMusic
 import os
 import json
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+from metrics import metrics
+from singleflight import SingleFlight
+from cache import TTLCache, content_hash
+from recommender import recommender
+from importer import import_into
+from backups import BackupWriter
+from library_mirror import library_mirror
+from search_cache import search_cache
+from progress import progress
+from auth_cache import sessions, file_fingerprint
 
 load_dotenv()
 
 class YouTubeMusicClient:
+    BATCH_WORKERS = 4
+    ADD_BATCH = 100
+
     def __init__(self):
         # Assumes auth via headers file; see ytmusicapi setup instructions
-        self.yt = YTMusic(os.getenv("YOUTUBE_AUTH_FILE"))
+        auth_file = os.getenv("YOUTUBE_AUTH_FILE")
+        self.yt = sessions.get(("youtube_music", file_fingerprint(auth_file)), lambda: self._connect(auth_file))
+        self._inflight = SingleFlight()
+        self._playlists = TTLCache(ttl=float(os.getenv("PLAYSYNC_PLAYLIST_TTL", "60")), maxsize=64)
+
+    @staticmethod
+    def _connect(auth_file):
+        """Build the API object once per process and auth file version"""
+        yt = YTMusic(auth_file)
+        metrics.attach_session(getattr(yt, "_session", None))
+        metrics.count_retries(getattr(yt, "_session", None), "youtube_music")
+        return yt
+
+    def _call(self, endpoint, func, *args, **kwargs):
+        """Run a YouTube Music API call through the metrics layer"""
+        return metrics.call("youtube_music", endpoint, func, *args, **kwargs)
+
+    def _shared_call(self, endpoint, func, *args, **kwargs):
+        """Run a read-only call, sharing the result with identical calls already in flight"""
+        key = (endpoint, args, tuple(sorted(kwargs.items())))
+        return self._inflight.do(key, self._call, endpoint, func, *args, **kwargs)
+
+    def _get_playlist(self, playlist_id):
+        """Fetch a playlist at most once per TTL window; every read of it shares the payload"""
+        playlist = self._playlists.get(playlist_id)
+        if playlist is None:
+            playlist = self._shared_call("playlist", self.yt.get_playlist, playlist_id)
+            self._playlists.set(playlist_id, playlist)
+        return playlist
 
     def get_playlist_tracks(self, playlist_id):
-        playlist = self.yt.get_playlist(playlist_id)
+        playlist = self._get_playlist(playlist_id)
         tracks = []
         for track in playlist['tracks']:
             tracks.append({
                 "name": track['title'],
                 "artist": track['artists'][0]['name'] if track['artists'] else "Unknown",
-                "album": track.get('album', {}).get('name', '')
+                "album": track.get('album', {}).get('name', ''),
+                "youtube_id": track.get('videoId')
             })
+        library_mirror.upsert(tracks)
         return tracks
 
+    def get_playlist_version(self, playlist_id):
+        """Get a content hash of the playlist payload"""
+        return content_hash(self._get_playlist(playlist_id))
+
     def create_playlist(self, name):
-        playlist_id = self.yt.create_playlist(name, "Created by PlaySync")
+        playlist_id = self._call("create_playlist", self.yt.create_playlist, name, "Created by PlaySync")
         return playlist_id
 
+    def _search_one(self, query):
+        search_results = self._shared_call("search", self.yt.search, query, filter="songs", limit=1)
+        return search_results[0].get('videoId') if search_results else None
+
+    def resolve_video_ids(self, tracks):
+        """Match tracks to YouTube Music video IDs, returning one ID (or None) per track
+
+        Video IDs known to the local library mirror (by ISRC or name/artist)
+        are used first. YouTube Music has no ISRC lookup, so the rest fall back
+        to a name/artist text search. Each distinct search runs once, concurrently.
+        """
+        known = [
+            track.get('youtube_id') or local_id
+            for track, local_id in zip(tracks, library_mirror.resolve(tracks, "youtube_id"))
+        ]
+        queries = list(dict.fromkeys(
+            f"{track['name']} {track['artist']}" for track, video_id in zip(tracks, known) if not video_id
+        ))
+        with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+            by_query = dict(zip(queries, executor.map(self._search_one, queries)))
+        return [
+            video_id or by_query.get(f"{track['name']} {track['artist']}")
+            for track, video_id in zip(tracks, known)
+        ]
+
     def add_tracks(self, playlist_id, tracks):
+        video_ids = list(dict.fromkeys(video_id for video_id in self.resolve_video_ids(tracks) if video_id))
         added = 0
-        for track in tracks:
-            query = f"{track['name']} {track['artist']}"
-            search_results = self.yt.search(query, filter="songs", limit=1)
-            if search_results:
-                video_id = search_results[0]['videoId']
-                self.yt.add_playlist_items(playlist_id, [video_id])
-                added += 1
+        try:
+            for i in range(0, len(video_ids), self.ADD_BATCH):
+                batch = video_ids[i:i + self.ADD_BATCH]
+                self._call("add_items", self.yt.add_playlist_items, playlist_id, batch)
+                added += len(batch)
+        finally:
+            self._playlists.invalidate(playlist_id)
         return added
 
     # NEW FUNCTIONS
 
-    def analyze_playlist(self, playlist_id):
-        """Get detailed statistics about a playlist"""
+    def analyze_playlist(self, playlist_id, tracks=None):
+        """Get detailed statistics about a playlist, reusing its tracks if the caller already fetched them"""
         try:
-            playlist = self.yt.get_playlist(playlist_id)
-            tracks = self.get_playlist_tracks(playlist_id)
+            playlist = self._get_playlist(playlist_id)
+            if tracks is None:
+                tracks = self.get_playlist_tracks(playlist_id)
             
             # Calculate statistics
             stats = {
@@ -96,7 +171,7 @@ class YouTubeMusicClient:
     def export_playlist(self, playlist_id, format='json'):
         """Export playlist to various formats"""
         try:
-            playlist = self.yt.get_playlist(playlist_id)
+            playlist = self._get_playlist(playlist_id)
             tracks = self.get_playlist_tracks(playlist_id)
             
             if format == 'json':
@@ -138,24 +213,9 @@ class YouTubeMusicClient:
             return None
 
     def import_playlist(self, filename, playlist_name=None):
-        """Import playlist from JSON file"""
+        """Import playlist from a JSON, CSV or TXT export, adding tracks as they are read"""
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            
-            playlist_data = data.get('playlist', data)
-            tracks = playlist_data['tracks']
-            name = playlist_name or playlist_data.get('name', 'Imported Playlist')
-            
-            playlist_id = self.create_playlist(name)
-            added_count = self.add_tracks(playlist_id, tracks)
-            
-            return {
-                "playlist_id": playlist_id,
-                "name": name,
-                "tracks_added": added_count,
-                "total_tracks": len(tracks)
-            }
+            return import_into(self, filename, playlist_name)
         except Exception as e:
             print(f"Error importing playlist: {e}")
             return None
@@ -163,7 +223,9 @@ class YouTubeMusicClient:
     def delete_playlist(self, playlist_id):
         """Delete a playlist"""
         try:
-            self.yt.delete_playlist(playlist_id)
+            self._call("delete_playlist", self.yt.delete_playlist, playlist_id)
+            self._playlists.invalidate(playlist_id)
+            recommender.remove_playlist("youtube_music", playlist_id)
             return True
         except Exception as e:
             print(f"Error deleting playlist: {e}")
@@ -172,7 +234,8 @@ class YouTubeMusicClient:
     def rename_playlist(self, playlist_id, new_name):
         """Rename a playlist"""
         try:
-            self.yt.edit_playlist(playlist_id, title=new_name)
+            self._call("edit_playlist", self.yt.edit_playlist, playlist_id, title=new_name)
+            self._playlists.invalidate(playlist_id)
             return True
         except Exception as e:
             print(f"Error renaming playlist: {e}")
@@ -181,7 +244,7 @@ class YouTubeMusicClient:
     def duplicate_playlist(self, playlist_id, new_name=None):
         """Duplicate a playlist"""
         try:
-            playlist = self.yt.get_playlist(playlist_id)
+            playlist = self._get_playlist(playlist_id)
             tracks = self.get_playlist_tracks(playlist_id)
             
             name = new_name or f"{playlist.get('title', 'Unknown')} (Copy)"
@@ -199,18 +262,34 @@ class YouTubeMusicClient:
             return None
 
     def search_tracks(self, query, limit=20):
-        """Search for tracks"""
+        """Search for tracks, answering from the search cache or the local library mirror when they can"""
+        cached = search_cache.get("youtube_music", query, limit)
+        if cached is not None:
+            return cached
         try:
-            results = self.yt.search(query, filter="songs", limit=limit)
+            local = library_mirror.search(query, limit, ("youtube_id",))
+            if len(local) >= limit:
+                return [{
+                    "id": row['youtube_id'],
+                    "youtube_id": row['youtube_id'],
+                    "name": row['name'],
+                    "artist": row['artist'],
+                    "album": row['album'],
+                    "duration": "{}:{:02d}".format(*divmod((row['duration_ms'] or 0) // 1000, 60))
+                } for row in local]
+            results = self._shared_call("search", self.yt.search, query, filter="songs", limit=limit)
             tracks = []
             for track in results:
                 tracks.append({
                     "id": track.get('videoId', ''),
+                    "youtube_id": track.get('videoId'),
                     "name": track.get('title', 'Unknown'),
                     "artist": track.get('artists', [{}])[0].get('name', 'Unknown') if track.get('artists') else 'Unknown',
                     "album": track.get('album', {}).get('name', ''),
                     "duration": track.get('duration', '0:00')
                 })
+            library_mirror.upsert(tracks)
+            search_cache.set("youtube_music", query, limit, tracks)
             return tracks
         except Exception as e:
             print(f"Error searching tracks: {e}")
@@ -219,7 +298,7 @@ class YouTubeMusicClient:
     def get_user_playlists(self):
         """Get all user playlists"""
         try:
-            playlists = self.yt.get_library_playlists()
+            playlists = self._call("user_playlists", self.yt.get_library_playlists)
             formatted_playlists = []
             for playlist in playlists:
                 formatted_playlists.append({
@@ -254,48 +333,54 @@ class YouTubeMusicClient:
 
     def backup_playlists(self, backup_dir="youtube_playlist_backups"):
         """Backup all user playlists"""
-        import os
-        os.makedirs(backup_dir, exist_ok=True)
-        
         playlists = self.get_user_playlists()
-        backup_info = {
-            "backup_date": datetime.now().isoformat(),
-            "total_playlists": len(playlists),
-            "playlists": []
-        }
         
-        for playlist in playlists:
-            try:
-                tracks = self.get_playlist_tracks(playlist['id'])
-                playlist_data = {
-                    "id": playlist['id'],
-                    "name": playlist['name'],
-                    "tracks_count": len(tracks),
-                    "tracks": tracks
-                }
-                backup_info["playlists"].append(playlist_data)
-                
-                # Save individual playlist
-                filename = f"{backup_dir}/playlist_{playlist['id']}.json"
-                with open(filename, 'w') as f:
-                    json.dump(playlist_data, f, indent=2)
+        with progress.job("YouTube Music backup", total=len(playlists)) as job, \
+                BackupWriter(backup_dir, len(playlists)) as writer:
+            for playlist in playlists:
+                try:
+                    job.set_phase(playlist['name'])
+                    tracks = self.get_playlist_tracks(playlist['id'])
+                    playlist_data = {
+                        "id": playlist['id'],
+                        "name": playlist['name'],
+                        "tracks_count": len(tracks),
+                        "tracks": tracks
+                    }
+                    writer.add(playlist_data)
+                    recommender.update_playlist("youtube_music", playlist['id'], tracks)
                     
-            except Exception as e:
-                print(f"Error backing up playlist {playlist['name']}: {e}")
-        
-        # Save backup summary
-        summary_file = f"{backup_dir}/backup_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(summary_file, 'w') as f:
-            json.dump(backup_info, f, indent=2)
+                    # Save individual playlist
+                    filename = f"{backup_dir}/playlist_{playlist['id']}.json"
+                    with open(filename, 'w') as f:
+                        json.dump(playlist_data, f, indent=2)
+                    job.advance(tracks=len(tracks))
+                        
+                except Exception as e:
+                    print(f"Error backing up playlist {playlist['name']}: {e}")
+                    job.advance()
         
-        return summary_file
+            job.set_phase("saving recommendations")
+            recommender.save()
+        return writer.summary_file
 
     def get_playlist_recommendations(self, playlist_id, limit=20):
-        """Get recommendations based on a playlist"""
+        """Get recommendations based on a playlist
+
+        Answered from the local co-occurrence recommender (built from backups)
+        when it has data, falling back to a search for the top artist.
+        """
         try:
-            tracks = self.get_playlist_tracks(playlist_id)
+            tracks = recommender.playlist_tracks("youtube_music", playlist_id)
+            if tracks is None:
+                tracks = self.get_playlist_tracks(playlist_id)
+                recommender.update_playlist("youtube_music", playlist_id, tracks)
             if not tracks:
                 return []
+
+            recommendations = recommender.recommend(tracks, limit)
+            if recommendations:
+                return recommendations
             
             # Get top artists from playlist
             artist_counts = {}
@@ -319,7 +404,7 @@ class YouTubeMusicClient:
             # YouTube Music doesn't have a direct trending playlists endpoint
             # This is a placeholder that could be implemented with web scraping
             # or by using YouTube's trending music videos
-            trending = self.yt.get_trending(region=region, category="music")
+            trending = self._call("trending", self.yt.get_trending, region=region, category="music")
             return trending[:limit]
         except Exception as e:
             print(f"Error getting trending playlists: {e}")
@@ -328,7 +413,7 @@ class YouTubeMusicClient:
     def get_playlist_audio_info(self, playlist_id):
         """Get audio information for playlist tracks"""
         try:
-            playlist = self.yt.get_playlist(playlist_id)
+            playlist = self._get_playlist(playlist_id)
             audio_info = []
             
             for track in playlist['tracks']: